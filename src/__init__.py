@@ -0,0 +1,36 @@
+import importlib
+
+API = {
+    "FinancialDB" : "database",
+    "DataBursatil" : "databursatil",
+    "CoinGecko" : "coingecko",
+    "ResponseCache" : "cache",
+    "provider_for" : "provider",
+    "refresh_history" : "provider",
+    "ingest_history" : "ingest",
+    "resample_weekly" : "resample",
+    "render_charts" : "plots",
+    "RefreshDaemon" : "scheduler",
+    "portfolio_stats" : "analytics",
+}
+
+MODULES = ("analytics", "benchmarks", "cache", "cli", "coingecko", "database", "databursatil",
+           "ingest", "plots", "provider", "resample", "scheduler", "transport")
+
+__all__ = list(API)
+
+def __getattr__ (name):
+    """Importa el módulo de un nombre público la primera vez que se pide"""
+
+    if name in API:
+        value = getattr(importlib.import_module(f".{API[name]}", __name__), name)
+    elif name in MODULES:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    globals()[name] = value
+    return value
+
+def __dir__ ():
+    return sorted(set(globals()) | set(API) | set(MODULES))
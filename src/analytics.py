@@ -0,0 +1,234 @@
+import numpy as np
+from datetime import timedelta
+
+WEEKS_PER_YEAR = 52
+
+DAYS_PER_YEAR = 365.25
+
+def portfolio_matrix (local_db, symbols_list, init, end):
+    """Consulta los valores semanales y el costo acumulado de los símbolos y
+    devuelve un diccionario con las claves, las fechas y las matrices de valor,
+    costo y flujos con un símbolo por fila y una semana por columna"""
+
+    # Las semanas empiezan en lunes y el costo debe incluir lo comprado antes
+    monday = init - timedelta(days=init.weekday())
+    values = local_db.consult_value_history(symbols_list, monday, end, columnar=True)
+    costs, initial_costs = local_db.consult_accumulated_buys_timetable(symbols_list, monday, end, columnar=True)
+
+    # Calendario común de todos los símbolos
+    utc_dates = np.unique(np.concatenate([np.empty(0, dtype=np.int64)]
+                                         + [values[key]["dates"] for key in symbols_list]))
+    shape = (len(symbols_list), len(utc_dates))
+    value_matrix, present = np.zeros(shape), np.zeros(shape, dtype=bool)
+    cost_matrix = np.zeros(shape)
+
+    for row, key in enumerate(symbols_list):
+        # Coloca cada valor en su semana del calendario
+        columns = np.searchsorted(utc_dates, values[key]["dates"])
+        value_matrix[row, columns] = values[key]["values"]
+        present[row, columns] = True
+
+        # El costo vigente es el último acumulado antes de cada semana
+        before = np.searchsorted(costs[key]["dates"], utc_dates, side="left")
+        cost_matrix[row] = np.concatenate(([initial_costs[key]], costs[key]["values"]))[before]
+
+    # Conserva el último valor conocido en las semanas sin precio
+    last = np.where(present, np.arange(shape[1]), -1)
+    np.maximum.accumulate(last, axis=1, out=last)
+    value_matrix = np.where(last >= 0, np.take_along_axis(value_matrix, np.maximum(last, 0), axis=1), 0.0)
+
+    flows = np.diff(cost_matrix, axis=1, prepend=cost_matrix[:,:1])
+    return {"symbols" : list(symbols_list), "dates" : local_db.utc2datetime64(utc_dates),
+            "values" : value_matrix, "costs" : cost_matrix, "flows" : flows}
+
+def period_returns (values, flows):
+    """Devuelve los rendimientos semanales descontando los flujos; el resultado
+    tiene una semana menos que los valores"""
+
+    values, flows = np.asarray(values, dtype=float), np.asarray(flows, dtype=float)
+    capital = values[...,:-1] + flows[...,1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(capital > 0, values[...,1:] / capital - 1.0, np.nan)
+
+def time_weighted_return (returns, annualize=False):
+    """Encadena los rendimientos por periodo en el rendimiento ponderado por
+    tiempo, opcionalmente anualizado"""
+
+    returns = np.asarray(returns, dtype=float)
+    growth = np.nanprod(1.0 + returns, axis=-1)
+    if not annualize:
+        return growth - 1.0
+
+    periods = returns.shape[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return growth ** (WEEKS_PER_YEAR / periods) - 1.0 if periods else growth - 1.0
+
+def _net_present_value (cash, years, rates):
+    """Devuelve el valor presente neto de los flujos y su derivada para cada
+    logaritmo de tasa"""
+
+    discount = np.exp(-rates[:,None] * years)
+    return (cash * discount).sum(axis=1), -(cash * years * discount).sum(axis=1)
+
+def money_weighted_return (dates, values, flows, bounds=(-5.0, 5.0), tolerance=1e-10, iterations=100):
+    """Calcula la tasa interna de retorno anual de los flujos y el valor final
+    de cada fila"""
+
+    values, flows = np.asarray(values, dtype=float), np.asarray(flows, dtype=float)
+    single = values.ndim == 1
+    values, flows = np.atleast_2d(values), np.atleast_2d(flows)
+
+    # Flujos desde el punto de vista del inversionista
+    cash = -flows.copy()
+    cash[:,0] = -values[:,0]
+    cash[:,-1] += values[:,-1]
+    years = (dates - dates[0]).astype(np.int64) / DAYS_PER_YEAR
+
+    # Sólo tienen tasa las filas con una raíz en el intervalo
+    low, high = np.full(len(cash), bounds[0]), np.full(len(cash), bounds[1])
+    valid = (_net_present_value(cash, years, low)[0] > 0) & (_net_present_value(cash, years, high)[0] < 0)
+    rates = np.where(valid, 0.0, np.nan)
+    previous = high - low
+    active = valid
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for _ in range(iterations):
+            npv, slope = _net_present_value(cash, years, rates)
+
+            # El valor presente decrece con la tasa: acota la raíz
+            low = np.where(npv > 0, rates, low)
+            high = np.where(npv > 0, high, rates)
+
+            # Bisecta si Newton sale del intervalo o no reduce el paso a la mitad
+            step = rates - npv / slope
+            bisect = ~np.isfinite(step) | (step <= low) | (step >= high) | (2 * np.abs(step - rates) > previous)
+            new_rates = np.where(bisect, (low + high) / 2, step)
+
+            # Las filas que ya convergieron dejan de moverse
+            previous = np.where(active, np.abs(new_rates - rates), previous)
+            rates = np.where(active, new_rates, rates)
+            active = active & (previous >= tolerance)
+            if not active.any():
+                break
+
+    result = np.expm1(rates)
+    return result[0] if single else result
+
+def max_drawdown (returns):
+    """Devuelve la caída máxima del índice de riqueza y los índices de las
+    fechas del máximo previo y del mínimo"""
+
+    returns = np.nan_to_num(np.asarray(returns, dtype=float))
+    wealth = np.cumprod(np.concatenate((np.ones(returns.shape[:-1] + (1,)), 1.0 + returns), axis=-1), axis=-1)
+    peaks = np.maximum.accumulate(wealth, axis=-1)
+    drawdowns = wealth / peaks - 1.0
+
+    # Índice del máximo vigente en cada semana
+    indexes = np.broadcast_to(np.arange(wealth.shape[-1]), wealth.shape)
+    peak_indexes = np.maximum.accumulate(np.where(wealth == peaks, indexes, 0), axis=-1)
+
+    trough = np.argmin(drawdowns, axis=-1)
+    peak = np.take_along_axis(peak_indexes, np.expand_dims(trough, -1), axis=-1)[...,0]
+    return np.take_along_axis(drawdowns, np.expand_dims(trough, -1), axis=-1)[...,0], peak, trough
+
+def volatility (returns):
+    """Devuelve la volatilidad anualizada de los rendimientos semanales"""
+
+    returns = np.asarray(returns, dtype=float)
+    valid = ~np.isnan(returns)
+    count = valid.sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(valid, returns, 0.0).sum(axis=-1) / count
+        squares = np.where(valid, returns - mean[...,None], 0.0) ** 2
+        return np.sqrt(squares.sum(axis=-1) / (count - 1) * WEEKS_PER_YEAR)
+
+def rolling_volatility (returns, window=12):
+    """Devuelve la volatilidad anualizada de cada ventana de window semanas"""
+
+    returns = np.asarray(returns, dtype=float)
+    if returns.shape[-1] < window:
+        return np.empty(returns.shape[:-1] + (0,))
+    return volatility(np.lib.stride_tricks.sliding_window_view(returns, window, axis=-1))
+
+def roe_roi (current_value, buy_value):
+    """Devuelve la ganancia y el rendimiento porcentual de lo invertido"""
+
+    roe = current_value - buy_value
+    roi = (roe / buy_value)*100
+    return roe, roi
+
+def section_attribution (matrix, sections):
+    """Dadas las matrices del portafolio y la sección de cada símbolo, devuelve
+    por sección la ganancia, la contribución al rendimiento del portafolio y su
+    rendimiento ponderado por tiempo"""
+
+    values, flows = matrix["values"], matrix["flows"]
+    names, groups = np.unique([str(sections[key]) for key in matrix["symbols"]], return_inverse=True)
+    if values.shape[1] < 2:
+        return { str(name) : {"gain" : 0.0, "contribution" : 0.0, "twr" : 0.0} for name in names }
+
+    # Ganancia de cada símbolo por semana y capital del portafolio
+    gains = np.diff(values, axis=1) - flows[:,1:]
+    capital = values[:,:-1].sum(axis=0) + flows[:,1:].sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        contributions = np.where(capital > 0, gains / capital, 0.0)
+
+    # Pondera cada semana con la riqueza acumulada del portafolio
+    returns = np.nan_to_num(contributions.sum(axis=0))
+    wealth = np.concatenate(([1.0], np.cumprod(1.0 + returns)[:-1]))
+
+    # Suma por sección
+    section_gains, section_contributions = np.zeros(len(names)), np.zeros(len(names))
+    section_values, section_flows = np.zeros((len(names), values.shape[1])), np.zeros((len(names), values.shape[1]))
+    np.add.at(section_gains, groups, gains.sum(axis=1))
+    np.add.at(section_contributions, groups, contributions @ wealth)
+    np.add.at(section_values, groups, values)
+    np.add.at(section_flows, groups, flows)
+    section_twr = time_weighted_return(period_returns(section_values, section_flows))
+
+    return { str(name) : {"gain" : float(section_gains[i]), "contribution" : float(section_contributions[i]),
+                     "twr" : float(section_twr[i])}
+             for i, name in enumerate(names) }
+
+def _stats (dates, metrics, row):
+    """Reúne las métricas de una fila de las matrices"""
+
+    stats = { name : float(metric[row]) for name, metric in metrics.items() if name not in ("peak", "trough") }
+    stats["drawdown_dates"] = (dates[metrics["peak"][row]].item(), dates[metrics["trough"][row]].item())
+    return stats
+
+def portfolio_stats (local_db, symbols_list, init, end, window=12):
+    """Calcula las estadísticas del portafolio, de cada símbolo y de cada
+    sección entre las fechas dadas"""
+
+    if symbols_list is None:
+        symbols_list = list(local_db.consult_symbols_sources())
+    matrix = portfolio_matrix(local_db, symbols_list, init, end)
+    dates = matrix["dates"]
+    if len(dates) < 2:
+        raise ValueError(f"Se requieren al menos dos semanas de valores entre {init} y {end}")
+
+    # La última fila es el portafolio completo
+    values = np.vstack((matrix["values"], matrix["values"].sum(axis=0)))
+    costs = np.vstack((matrix["costs"], matrix["costs"].sum(axis=0)))
+    flows = np.vstack((matrix["flows"], matrix["flows"].sum(axis=0)))
+
+    # Métricas de todas las filas a la vez
+    returns = period_returns(values, flows)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        roe, roi = roe_roi(values[:,-1], costs[:,-1])
+    drawdown, peak, trough = max_drawdown(returns)
+    metrics = {"value" : values[:,-1], "invested" : costs[:,-1],
+               "roe" : roe, "roi" : np.where(costs[:,-1] > 0, roi, np.nan),
+               "twr" : time_weighted_return(returns),
+               "twr_annual" : time_weighted_return(returns, annualize=True),
+               "mwr" : money_weighted_return(dates, values, flows),
+               "max_drawdown" : drawdown, "peak" : peak, "trough" : trough,
+               "volatility" : volatility(returns)}
+
+    portfolio = _stats(dates, metrics, -1)
+    portfolio["rolling_volatility"] = {"dates" : dates[window:], "values" : rolling_volatility(returns[-1], window)}
+
+    return {"init" : dates[0].item(), "end" : dates[-1].item(), "portfolio" : portfolio,
+            "symbols" : { key : _stats(dates, metrics, row) for row, key in enumerate(symbols_list) },
+            "sections" : section_attribution(matrix, local_db.consult_symbols_sections(symbols_list))}
@@ -0,0 +1,412 @@
+import csv, os, random, subprocess, sys, tempfile, timeit
+from datetime import date, datetime, timedelta
+from . import database, provider, resample
+
+def _best_time (function, repeat=3):
+    """Ejecuta la función varias veces y devuelve el mejor tiempo en
+    milisegundos"""
+
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1000
+
+def _synthetic_database (db_path, n_symbols, n_weeks, n_buys, seed=0):
+    """Crea una base de datos con un portafolio sintético y devuelve el objeto,
+    las claves de los símbolos y las fechas de inicio y fin de los precios"""
+
+    # Usa una semilla fija para que las mediciones sean comparables
+    rng = random.Random(seed)
+    first_monday = date(2000, 1, 3)
+    symbols = [f"S{i:04d}" for i in range(n_symbols)]
+
+    # Registra los productos
+    local_db = database.FinancialDB(db_path)
+    products = [["Sección", "Emisora", "Serie", "Origen", "Tipo", "Compañía", "Notas"]]
+    products += [["SYN", symbol, "*", "synthetic", "", "", ""] for symbol in symbols]
+    local_db.bulk_insert_product(products)
+
+    # Registra compras en fechas aleatorias dentro del rango
+    header = [[""] * 13] * 2
+    buys = header + [["", "", rng.choice(symbols), "*",
+                      (first_monday + timedelta(days=rng.randrange(7 * n_weeks))).isoformat(),
+                      "DONE", rng.uniform(1, 10), "", "", "", "", rng.uniform(10, 1000), ""]
+                     for _ in range(n_buys)]
+    local_db.bulk_insert_buys(buys, header)
+
+    # Registra un precio por semana para cada símbolo
+    prices = { (symbol, "*") : { first_monday + timedelta(weeks=week) : rng.uniform(10, 100)
+                                 for week in range(n_weeks)}
+               for symbol in symbols}
+    local_db.bulk_insert_prices(prices)
+
+    return local_db, list(prices.keys()), first_monday, first_monday + timedelta(weeks=n_weeks)
+
+def benchmark_asof_lookup (sizes=(10, 100, 1000, 5000), n_prices=520, repeat=3):
+    """Compara la búsqueda lineal de la última compra anterior a cada precio con
+    la búsqueda usando bisect"""
+
+    rows = [["Compras", "Precios", "Lineal (ms)", "bisect (ms)"]]
+    first_monday = date(2000, 1, 3)
+    prices = { first_monday + timedelta(weeks=week) : 100.0 + week for week in range(n_prices)}
+
+    for n_buys in sizes:
+        # Genera compras ordenadas y repartidas en todo el rango
+        step = 7 * n_prices / n_buys
+        timetable = { first_monday + timedelta(days=int(i * step)) : float(i) for i in range(n_buys)}
+
+        # Búsqueda lineal, como se hacía originalmente, para valuar cada precio
+        def linear ():
+            values = []
+            for price_date, price in prices.items():
+                viable = [buy_date for buy_date in timetable.keys() if buy_date < price_date]
+                qty = 0.0 if len(viable) == 0 else timetable[max(viable)]
+                values.append(qty * price)
+            return values
+
+        # Búsqueda con bisect sobre las listas ordenadas
+        def bisected ():
+            values = []
+            buy_dates, buy_qtys = list(timetable.keys()), list(timetable.values())
+            for price_date, price in prices.items():
+                qty = database.FinancialDB._value_before(buy_dates, buy_qtys, price_date)
+                values.append(qty * price)
+            return values
+
+        rows.append([n_buys, n_prices, round(_best_time(linear, repeat), 2), round(_best_time(bisected, repeat), 2)])
+
+    return rows
+
+def benchmark_value_history (sizes=((10, 52, 50), (10, 260, 250), (20, 520, 1000), (40, 1040, 4000)), repeat=3):
+    """Mide consult_value_history y consult_accumulated_buys_timetable sobre
+    portafolios sintéticos de distintos tamaños"""
+
+    rows = [["Símbolos", "Semanas", "Compras", "value_history (ms)", "accumulated_buys (ms)"]]
+
+    for n_symbols, n_weeks, n_buys in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            # Crea el portafolio en un archivo temporal
+            db_path = os.path.join(directory, "benchmark.db")
+            local_db, keys, init, end = _synthetic_database(db_path, n_symbols, n_weeks, n_buys)
+
+            # Mide ambas consultas dentro de una misma sesión
+            with local_db.session():
+                values_time = _best_time(lambda: local_db.consult_value_history(keys, init, end), repeat)
+                buys_time = _best_time(lambda: local_db.consult_accumulated_buys_timetable(keys, init, end), repeat)
+
+        rows.append([n_symbols, n_weeks, n_buys, round(values_time, 2), round(buys_time, 2)])
+
+    return rows
+
+def benchmark_weekly_values (sizes=((10, 260, 250), (40, 1040, 4000), (100, 1040, 20000)), weeks=30, repeat=5):
+    """Compara el recálculo de los valores semanales con la lectura de
+    weekly_values y mide el costo de actualizarla con precios y compras"""
+
+    rows = [["Símbolos", "Semanas", "Compras", "Recálculo (ms)", "weekly_values (ms)", "Semana nueva (ms)", "Compra (ms)"]]
+
+    for n_symbols, n_weeks, n_buys in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, "benchmark.db")
+            local_db, keys, init, end = _synthetic_database(db_path, n_symbols, n_weeks, n_buys)
+            recent = end - timedelta(weeks=weeks)
+
+            # Recálculo original: posiciones y precios, buscando la cantidad vigente
+            def recompute ():
+                placeholders = ','.join(['?']*len(keys))
+                ids = [local_db._symbols_ids()[key] for key in keys]
+                symbols = local_db._ids_symbols()
+                SQL_PRICES, _ = local_db._price_query(None, placeholders)
+                positions = local_db._execute_query(f"""SELECT symbol, date, qty FROM positions
+                WHERE symbol IN ({placeholders}) ORDER BY date""", ids)["fetched"]
+                prices = local_db._execute_query(SQL_PRICES, ids + [local_db._date2utc(recent), local_db._date2utc(end)])["fetched"]
+                timetables = { key : ([], []) for key in keys }
+                for symbol_id, utc_date, qty in positions:
+                    timetables[symbols[symbol_id]][0].append(local_db._utc2date(utc_date))
+                    timetables[symbols[symbol_id]][1].append(qty)
+                values = { key : {} for key in keys }
+                for symbol_id, utc_date, price in prices:
+                    price_date = local_db._utc2date(utc_date)
+                    dates, qtys = timetables[symbols[symbol_id]]
+                    values[symbols[symbol_id]][price_date] = price * local_db._value_before(dates, qtys, price_date)
+                return values
+
+            with local_db.session():
+                recompute_time = _best_time(recompute, repeat)
+                slice_time = _best_time(lambda: local_db.consult_value_history(keys, recent, end), repeat)
+
+                # Una semana nueva para todos los símbolos y una compra atrasada
+                prices = { key : { end : 50.0 } for key in keys }
+                price_time = _best_time(lambda: local_db.bulk_insert_prices(prices), 1)
+                header = [[""] * 13] * 2
+                buy = header + [["", "", keys[0][0], "*", (end - timedelta(weeks=52)).isoformat(), "DONE", 1, "", "", "", "", 10.0, ""]]
+                buy_time = _best_time(lambda: local_db.bulk_insert_buys(buy, header), 1)
+
+        rows.append([n_symbols, n_weeks, n_buys] + [round(milliseconds, 2) for milliseconds in (recompute_time, slice_time, price_time, buy_time)])
+
+    return rows
+
+def benchmark_positions (sizes=(1000, 10000, 100000), n_symbols=40, repeat=5):
+    """Compara la suma completa de las compras con la lectura del libro de
+    posiciones para obtener la cantidad vigente de cada símbolo"""
+
+    rows = [["Símbolos", "Compras", "SUM(qty) (ms)", "positions (ms)", "section_value (ms)"]]
+    SQL_SUM = "SELECT symbol, SUM(qty) FROM buys GROUP BY symbol"
+    SQL_LEDGER = """SELECT products.id, (SELECT positions.qty FROM positions WHERE positions.symbol = products.id
+                                         ORDER BY positions.date DESC LIMIT 1) FROM products"""
+
+    for n_buys in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            # Crea el portafolio en un archivo temporal
+            db_path = os.path.join(directory, "benchmark.db")
+            local_db, keys, init, end = _synthetic_database(db_path, n_symbols, 52, n_buys)
+
+            # Mide ambas consultas dentro de una misma sesión
+            with local_db.session():
+                sum_time = _best_time(lambda: local_db._execute_query(SQL_SUM), repeat)
+                ledger_time = _best_time(lambda: local_db._execute_query(SQL_LEDGER), repeat)
+                section_time = _best_time(lambda: local_db.consult_section_value(), repeat)
+
+        rows.append([n_symbols, n_buys, round(sum_time, 2), round(ledger_time, 2), round(section_time, 2)])
+
+    return rows
+
+def benchmark_latest_prices (sizes=(52, 520, 2600), n_symbols=40, repeat=5):
+    """Compara la búsqueda del último precio en la tabla de precios con la
+    lectura de la tabla latest_price"""
+
+    rows = [["Símbolos", "Semanas", "MAX(date) (ms)", "latest_price (ms)", "last_value (ms)"]]
+    SQL_MAX = "SELECT symbol, price, MAX(date) FROM prices GROUP BY symbol"
+    SQL_LATEST = "SELECT symbol, price, date FROM latest_price"
+
+    for n_weeks in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            # Crea el portafolio en un archivo temporal
+            db_path = os.path.join(directory, "benchmark.db")
+            local_db, keys, init, end = _synthetic_database(db_path, n_symbols, n_weeks, 100)
+
+            # Mide ambas consultas dentro de una misma sesión
+            with local_db.session():
+                max_time = _best_time(lambda: local_db._execute_query(SQL_MAX), repeat)
+                latest_time = _best_time(lambda: local_db._execute_query(SQL_LATEST), repeat)
+                value_time = _best_time(lambda: local_db.consult_last_value(keys), repeat)
+
+        rows.append([n_symbols, n_weeks, round(max_time, 2), round(latest_time, 2), round(value_time, 2)])
+
+    return rows
+
+def benchmark_buys_import (sizes=(10000, 100000, 300000), n_symbols=100, chunk_size=10000, repeat=3):
+    """Mide las filas por segundo del procesamiento original y el nuevo de
+    las tablas de operaciones y de la importación completa desde una tabla y
+    desde un archivo CSV"""
+
+    rows = [["Filas", "Original (filas/s)", "Una pasada (filas/s)", "bulk_insert_buys (filas/s)", "CSV (filas/s)"]]
+    rng = random.Random(0)
+    symbols = [f"S{i:04d}" for i in range(n_symbols)]
+    products = [["Sección", "Emisora", "Serie", "Origen", "Tipo", "Compañía", "Notas"]]
+    products += [["SYN", symbol, "*", "synthetic", "", "", ""] for symbol in symbols]
+    header = [["", "Cartera", "Producto", "Serie", "Fecha", "Status", "Cantidad", "Valor unitario",
+               "Costo agregado", "Comisión", "IVA", "Costo total", "Anotaciones"], [""] * 13]
+
+    for n_rows in sizes:
+        # Genera una tabla de operaciones con el formato de org
+        table = header + [["", "", rng.choice(symbols), "*",
+                           (date(2010, 1, 4) + timedelta(weeks=rng.randrange(520), days=rng.randrange(5))).isoformat(),
+                           "DONE", rng.randint(1, 100), "", "", "", "", rng.uniform(10, 1000), ""]
+                          for _ in range(n_rows)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Registra los productos y guarda la tabla como CSV
+            local_db = database.FinancialDB(os.path.join(directory, "benchmark.db"))
+            local_db.bulk_insert_product(products)
+            ids_dictionary = local_db._symbols_ids()
+            csv_path = os.path.join(directory, "buys.csv")
+            with open(csv_path, "w", newline="") as csv_file:
+                csv.writer(csv_file).writerows([header[0]] + table[2:])
+
+            # Procesamiento original: strptime, lista de tickets y sumas de tuplas
+            def original ():
+                tickets = [(str(symbol), str(serie), int(datetime.strptime(day, "%Y-%m-%d").timestamp()), qty, price)
+                           for _, _, symbol, serie, day, status, qty, _, _, _, _, price, _ in table[2:]
+                           if status == 'DONE']
+                day_tickets = {}
+                for symbol, serie, utc_timestamp, qty, price in tickets:
+                    ticket_key = (ids_dictionary[(symbol, serie)], utc_timestamp)
+                    ticket_qty_price = day_tickets.get(ticket_key, (0.0, 0.0))
+                    day_tickets[ticket_key] = tuple(a + b for a, b in zip(ticket_qty_price, (qty, price)))
+
+            # Procesamiento nuevo en una sola pasada
+            def single_pass ():
+                database.FinancialDB._isodate2utc.cache_clear()
+                database.FinancialDB._aggregate_tickets(ids_dictionary, database.FinancialDB._bulk_op_processing(table))
+
+            # Importaciones completas, cada una sobre una tabla de compras vacía
+            def imported (function):
+                local_db._execute_query("DELETE FROM buys")
+                local_db._execute_query("DELETE FROM positions")
+                return _best_time(function, 1)
+
+            original_time = _best_time(original, repeat)
+            single_time = _best_time(single_pass, repeat)
+            table_time = min(imported(lambda: local_db.bulk_insert_buys(table, header, chunk_size=chunk_size)) for _ in range(repeat))
+            csv_time = min(imported(lambda: local_db.bulk_import_buys_csv(csv_path, chunk_size=chunk_size)) for _ in range(repeat))
+
+        rows.append([n_rows] + [round(n_rows / (milliseconds / 1000)) for milliseconds in (original_time, single_time, table_time, csv_time)])
+
+    return rows
+
+def benchmark_weekly_means (years=(1, 5, 10, 20), week_days=5, repeat=5):
+    """Compara el cálculo de promedios semanales lunes por lunes, por bloques
+    y vectorizado sobre históricos diarios de varios años"""
+
+    rows = [["Años", "Días", "Por lunes (ms)", "Por bloques (ms)", "resample (ms)"]]
+    rng = random.Random(0)
+    first_monday = date(2000, 1, 3)
+
+    # Proveedor mínimo con el calendario de la bolsa
+    class Weekdays (provider.Provider):
+        pass
+    Weekdays.week_days = week_days
+    scrapper = Weekdays()
+
+    for n_years in years:
+        days = [first_monday + timedelta(days=i) for i in range(365 * n_years)]
+        prices = { day : rng.uniform(10, 100) for day in days if day.weekday() < week_days }
+        mondays = Weekdays._mondays_between(days[0], days[-1])
+
+        # Lunes por lunes, como se hacía originalmente
+        def per_monday ():
+            means = {}
+            for monday in mondays:
+                week_prices = [ prices[day] for day in Weekdays._week_list(monday) if day in prices and prices[day] != 0.0 ]
+                means[monday] = sum(week_prices)/len(week_prices) if len(week_prices) != 0 else 0.0
+            return means
+
+        # Por bloques de parejas fecha, precio, como llegan de un generador
+        def chunked ():
+            return dict(scrapper._weekly_means(mondays, scrapper._batches(prices.items(), scrapper.stream_chunk_size)))
+
+        # Vectorizado, incluyendo la conversión a arreglos
+        def vectorized ():
+            dates, values = resample.from_pairs(prices)
+            return resample.to_dict(resample.resample_weekly(dates, values, week_days=week_days, mondays=mondays), "mean")
+
+        rows.append([n_years, len(prices), round(_best_time(per_monday, repeat), 2),
+                     round(_best_time(chunked, repeat), 2), round(_best_time(vectorized, repeat), 2)])
+
+    return rows
+
+def benchmark_chart_rendering (sizes=(8, 32), n_symbols=3, n_weeks=260, workers=(1, 4)):
+    """Compara el tiempo de generar gráficas una por una con pyplot contra
+    generarlas en lote sin interfaz con uno o varios procesos"""
+
+    import matplotlib
+    matplotlib.use("Agg")
+    from . import plots
+
+    rows = [["Gráficas", "pyplot (ms)"] + [f"render_charts x{n} (ms)" for n in workers]]
+    rng = random.Random(0)
+    first_monday = date(2015, 1, 5)
+    mondays = [first_monday + timedelta(weeks=i) for i in range(n_weeks)]
+    symbols_values = { (f"S{i:02d}", "*") : { monday : 1000 + 5 * week + rng.uniform(0, 50)
+                                              for week, monday in enumerate(mondays) }
+                       for i in range(n_symbols) }
+    buys_timetable = { key : { mondays[week] : 1.0 for week in sorted(rng.sample(range(n_weeks), 4)) }
+                       for key in symbols_values }
+
+    for n_charts in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            specs = [{"kind" : "value_history", "save_path" : os.path.join(directory, f"{i}.png"),
+                      "symbols_values" : symbols_values, "buys_timetable" : buys_timetable}
+                     for i in range(n_charts)]
+
+            # Una por una con pyplot
+            def sequential ():
+                for spec in specs:
+                    plots.plot_value_history(symbols_values, buys_timetable, save_path=spec["save_path"])
+
+            times = [_best_time(sequential, 1)]
+            times += [_best_time(lambda: plots.render_charts(specs, max_workers=n), 1) for n in workers]
+
+        rows.append([n_charts] + [round(milliseconds) for milliseconds in times])
+
+    return rows
+
+def benchmark_portfolio_stats (sizes=((10, 260, 250), (40, 1040, 4000), (100, 1040, 20000)), window=12,
+                               budget_ms=250.0, repeat=5):
+    """Mide el tiempo de consultar las matrices del portafolio y de calcular
+    sus estadísticas sobre todo el historial contra un presupuesto interactivo"""
+
+    from . import analytics
+
+    rows = [["Símbolos", "Semanas", "Compras", "Matrices (ms)", "portfolio_stats (ms)", "Interactivo"]]
+
+    for n_symbols, n_weeks, n_buys in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, "benchmark.db")
+            local_db, keys, init, end = _synthetic_database(db_path, n_symbols, n_weeks, n_buys)
+
+            with local_db.session():
+                matrix_time = _best_time(lambda: analytics.portfolio_matrix(local_db, keys, init, end), repeat)
+                stats_time = _best_time(lambda: analytics.portfolio_stats(local_db, keys, init, end, window), repeat)
+
+        rows.append([n_symbols, n_weeks, n_buys, round(matrix_time, 2), round(stats_time, 2),
+                     "sí" if stats_time <= budget_ms else "no"])
+
+    return rows
+
+HEAVY_MODULES = ("numpy", "matplotlib", "requests")
+
+INGEST_CLI_MODULES = ("cli", "database", "databursatil", "coingecko", "ingest", "scheduler")
+
+def _import_time (module):
+    """Importa un módulo del paquete en un proceso nuevo con -X importtime y
+    devuelve su tiempo acumulado en milisegundos, el tiempo total del proceso y
+    los módulos de primer nivel que se cargaron"""
+
+    name = f"{__package__}.{module}" if module else __package__
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(os.path.abspath(path) for path in sys.path if path))
+
+    start = timeit.default_timer()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {name}"],
+                             env=env, capture_output=True, text=True, check=True)
+    wall = (timeit.default_timer() - start) * 1000
+
+    # Cada línea es "import time: propio | acumulado | módulo"
+    cumulative, loaded = None, set()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, total, imported = line.split("|")
+        if not total.strip().isdigit():
+            continue
+        loaded.add(imported.strip().split(".")[0])
+        if imported.strip() == name:
+            cumulative = int(total) / 1000
+
+    return cumulative, wall, loaded
+
+def benchmark_import_time (modules=("", "cli", "database", "databursatil", "coingecko", "ingest", "provider", "plots", "resample"), repeat=3):
+    """Mide en procesos nuevos el tiempo de importación en frío de los módulos
+    del paquete y las dependencias pesadas que carga cada uno"""
+
+    rows = [["Módulo", "importtime (ms)", "Proceso (ms)", "Dependencias pesadas"]]
+    for module in modules:
+        measures = [_import_time(module) for _ in range(repeat)]
+        loaded = measures[0][2]
+        rows.append([module or __package__, round(min(cumulative for cumulative, _, _ in measures), 1),
+                     round(min(wall for _, wall, _ in measures), 1),
+                     ", ".join(heavy for heavy in HEAVY_MODULES if heavy in loaded)])
+
+    return rows
+
+def check_import_time (modules=INGEST_CLI_MODULES, budget_ms=100.0, forbidden=HEAVY_MODULES, repeat=3):
+    """Revisa el tiempo de importación en frío de los módulos de la ingesta y
+    devuelve por módulo las dependencias pesadas que carga y si excede el
+    presupuesto"""
+
+    problems = {}
+    for module in modules:
+        measures = [_import_time(module) for _ in range(repeat)]
+        cumulative = min(measure[0] for measure in measures)
+        problems[module] = [f"importa {heavy}" for heavy in forbidden if heavy in measures[0][2]]
+        if cumulative > budget_ms:
+            problems[module].append(f"tarda {cumulative:.1f} ms (presupuesto {budget_ms:.1f} ms)")
+
+    return problems
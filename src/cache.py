@@ -0,0 +1,120 @@
+import sqlite3, threading, time
+from collections import OrderedDict
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL)"""
+
+SCHEMA_INDEX = "CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)"
+
+class ResponseCache:
+    """Cache persistente de respuestas de las API con tiempo de vida y
+    descarte de las respuestas menos usadas"""
+
+    def __init__ (self, path, max_bytes=64*2**20, memory_entries=256):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.touched = {}
+        self.lock = threading.Lock()
+
+        # Abre el archivo, crea la tabla si no existe y calcula su tamaño
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA)
+        self.conn.execute(SCHEMA_INDEX)
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.conn.commit()
+
+    def get (self, key):
+        """Devuelve el texto guardado para la clave o None si no existe o ya
+        expiró"""
+
+        now = time.time()
+        with self.lock:
+            # Busca en memoria
+            if key in self.memory:
+                body, expires = self.memory[key]
+                if expires is None or expires > now:
+                    self.memory.move_to_end(key)
+                    self.touched[key] = now
+                    return body
+                self._discard(key)
+                self.conn.commit()
+                return None
+
+            # Busca en el archivo
+            row = self.conn.execute("SELECT body, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            body, expires = row
+            if expires is not None and expires <= now:
+                self._discard(key)
+                self.conn.commit()
+                return None
+
+            # Marca la respuesta como usada y la sube a memoria
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self._remember(key, body, expires)
+            return body
+
+    def set (self, key, body, ttl=None):
+        """Guarda el texto de una respuesta con un tiempo de vida en segundos,
+        None para que nunca expire"""
+
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        size = len(body.encode())
+        with self.lock:
+            # Reemplaza la respuesta anterior, ajustando el tamaño total
+            self._discard(key)
+            self.conn.execute("INSERT INTO responses VALUES (?, ?, ?, ?, ?)", (key, body, size, expires, now))
+            self.size += size
+            self._remember(key, body, expires)
+
+            # Descarta las respuestas menos usadas hasta respetar el límite,
+            # considerando también los usos que sólo se anotaron en memoria
+            if self.size > self.max_bytes:
+                self.conn.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                      [(accessed, used_key) for used_key, accessed in self.touched.items()])
+                self.touched.clear()
+                rows = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+                for old_key, old_size in rows:
+                    if self.size <= self.max_bytes or old_key == key:
+                        break
+                    self._discard(old_key)
+
+            self.conn.commit()
+
+    def clear (self):
+        """Descarta todas las respuestas guardadas"""
+
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+            self.memory.clear()
+            self.touched.clear()
+            self.size = 0
+
+    def _discard (self, key):
+        """Elimina una respuesta de memoria y del archivo"""
+
+        self.memory.pop(key, None)
+        self.touched.pop(key, None)
+        row = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.size -= row[0]
+
+    def _remember (self, key, body, expires):
+        """Guarda una respuesta en memoria respetando el número de entradas"""
+
+        self.memory[key] = (body, expires)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
@@ -0,0 +1,101 @@
+import argparse, os, signal
+from datetime import date, timedelta
+from . import database, provider, scheduler
+
+def _symbol_key (text):
+    """Convierte EMISORA:SERIE en la pareja símbolo+serie"""
+
+    symbol, _, series = text.partition(":")
+    return (symbol, series)
+
+def _token (text):
+    """Convierte ORIGEN=TOKEN en la pareja origen, token"""
+
+    src, separator, token = text.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError(f"Se esperaba ORIGEN=TOKEN, se recibió {text!r}")
+    return (src.strip().lower(), token)
+
+def build_parser ():
+    """Define los comandos y opciones de la línea de comandos"""
+
+    parser = argparse.ArgumentParser(prog="scrappers", description="Scrappers para seguimiento financiero")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    refresh = commands.add_parser("refresh", help="Actualiza los precios guardados en la base de datos")
+    refresh.add_argument("--db", required=True, help="Ruta de la base de datos")
+    refresh.add_argument("--symbols", nargs="+", type=_symbol_key, metavar="EMISORA:SERIE",
+                         help="Símbolos a actualizar (por defecto, todos los productos registrados)")
+    refresh.add_argument("--since", type=date.fromisoformat, default=date.today() - timedelta(weeks=52),
+                         help="Fecha desde la que se esperan precios (por defecto, hace un año)")
+    refresh.add_argument("--token", action="append", type=_token, default=[], metavar="ORIGEN=TOKEN",
+                         help="Token de un proveedor; también se lee de ORIGEN_TOKEN")
+    refresh.add_argument("--merge-gap", type=int, default=0, help="Semanas guardadas que se consultan para unir rangos")
+    refresh.add_argument("--workers", type=int, default=4, help="Consultas simultáneas por proveedor")
+    refresh.add_argument("--commit-size", type=int, default=1000, help="Filas por transacción")
+    refresh.add_argument("--daily", action="store_true", help="Guarda también los precios diarios")
+    refresh.add_argument("--daemon", action="store_true", help="Sigue corriendo y actualiza según el horario de cada mercado")
+    refresh.add_argument("--poll", type=float, default=60, help="Segundos máximos entre revisiones del servicio")
+
+    return parser
+
+def _scrappers (sources, tokens):
+    """Construye un scrapper por origen con el token de la línea de comandos o
+    de la variable de entorno"""
+
+    tokens = dict(tokens)
+    scrappers = {}
+    for src in sources:
+        token = tokens.get(src, os.environ.get(f"{src.upper()}_TOKEN"))
+        scrappers[src] = provider.provider_for(src)(token)
+    return scrappers
+
+def _print_report (src, report):
+    """Imprime el resumen de la ingesta de un proveedor"""
+
+    print(f"{src or '(sin origen)'}: {report['inserted']} precios nuevos, {len(report['failed'])} fallas en {report['seconds']:.1f} s", flush=True)
+    for (symbol, series), error in report["failed"].items():
+        print(f"  {symbol}:{series} {error!r}", flush=True)
+
+def refresh (args):
+    """Actualiza los precios una vez o como servicio"""
+
+    local_db = database.FinancialDB(args.db)
+    sources = local_db.consult_symbols_sources()
+
+    # Reporta los símbolos que no están registrados
+    unknown = {}
+    if args.symbols is not None:
+        unknown = { symbol_key : KeyError(f"El producto {symbol_key!r} no está registrado")
+                    for symbol_key in args.symbols if symbol_key not in sources }
+        sources = { symbol_key : sources[symbol_key] for symbol_key in args.symbols if symbol_key in sources }
+    if unknown:
+        _print_report("(sin registrar)", provider.failed_report(unknown))
+
+    groups, _ = provider.group_sources(sources)
+    scrappers = _scrappers(groups, args.token)
+
+    if not args.daemon:
+        reports = provider.refresh_history(local_db, list(sources), args.since, scrappers, args.merge_gap,
+                                           args.workers, args.commit_size, args.daily)
+        for src, report in reports.items():
+            _print_report(src, report)
+        return 1 if unknown or any(report["failed"] for report in reports.values()) else 0
+
+    daemon = scheduler.RefreshDaemon(local_db, args.since, list(sources), scrappers, args.merge_gap,
+                                     args.workers, args.commit_size, on_report=_print_report,
+                                     daily=args.daily)
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    try:
+        daemon.run_forever(args.poll)
+    except KeyboardInterrupt:
+        daemon.stop()
+    return 1 if unknown else 0
+
+COMMANDS = {"refresh" : refresh}
+
+def main (argv=None):
+    """Punto de entrada de la línea de comandos"""
+
+    args = build_parser().parse_args(argv)
+    return COMMANDS[args.command](args)
@@ -1,92 +1,156 @@
-import requests,json
+import json, threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, time, timedelta
+from . import provider, transport
 
-class CoinGecko:
+@provider.register
+class CoinGecko(provider.Provider):
     """Clase muy simple para contactar con la API de CoinGecko"""
-    token = None
-    _IDs = {'ETH' : 'ethereum', 'BTC' : 'bitcoin', 'XLM' : 'stellar'}
+    name = "CoinGecko"
+    rate_limit = (30, 60)
+    credit_costs = {"last_price" : 1, "price_history" : 1, "coins_list" : 1}
+    cache_ttl = {"last_price" : 60, "price_history" : 3600, "coins_list" : 86400}
+    batch_size = 100
+    chunk_days = 365
+    min_chunk_days = 91
+    chunk_workers = 4
+    base_url = "https://api.coingecko.com/api/v3"
+    week_days = 7
+    week_cutoff = 6
+    coin_ids = {'ETH' : 'ethereum', 'BTC' : 'bitcoin', 'XLM' : 'stellar'}
+
+    def __init__ (self, user_token=None, session=None, timeout=None, limiter=None, budget=None, cache=None, coin_ids=None):
+        super().__init__(user_token, session, timeout, limiter, budget, cache)
+        self.coin_ids = {**self.coin_ids, **(coin_ids or {})}
+        self._coins_list = None
+        self._coins_lock = threading.Lock()
+
+    def coin_id (self, coin_symbol):
+        """Traduce el símbolo de una moneda al identificador de CoinGecko"""
+
+        if coin_symbol in self.coin_ids:
+            return self.coin_ids[coin_symbol]
+
+        # Consulta la lista de monedas una sola vez
+        with self._coins_lock:
+            if self._coins_list is None:
+                URL = f"{self.base_url}/coins/list"
+                self._coins_list = json.loads(self._get(URL, "coins_list", key="all"))
+
+        # Sólo acepta los símbolos que corresponden a una sola moneda
+        candidates = [ coin["id"] for coin in self._coins_list if coin["symbol"].lower() == coin_symbol.lower() ]
+        if len(candidates) != 1:
+            raise KeyError(f"El símbolo {coin_symbol!r} corresponde a {len(candidates)} monedas {candidates[:10]}, "
+                           "agrégalo a coin_ids")
+
+        self.coin_ids[coin_symbol] = candidates[0]
+        return candidates[0]
+
+    def _asset (self, symbol_key):
+        """Traduce una clave símbolo+serie a los argumentos de consulta; la
+        serie no existe para una criptomoneda y se ignora"""
+
+        coin_symbol, _ = symbol_key
+        return (self.coin_id(coin_symbol),)
 
-    def __init__ (self, user_token=None):
-        self.token = user_token
-
-    @staticmethod
-    def _mondays_between (init, end):
-        """Pequeña función que genera una lista con todos los lunes entre las
-        fechas que se introducen"""
-
-        days_since_monday_init = init.weekday()
-        init_monday = init - timedelta(days=days_since_monday_init)
-
-        days_since_monday_end = end.weekday()
-        if days_since_monday_end >= 6:
-            end_monday = end - timedelta(days=days_since_monday_end)
-        else:
-            end_monday = end - timedelta(days=days_since_monday_end + 7)
-
-        weeks = (end_monday - init_monday).days // 7
+    def last_price (self, coin_name):
+        """Función para consulta el último precio registrado en la plataforma y
+        devolverlo como float"""
+        URL = f"{self.base_url}/simple/price?ids={coin_name}&vs_currencies=mxn"
+        response = json.loads(self._get(URL, "last_price", key=coin_name))
+        return float(response[coin_name]["mxn"])
 
-        if weeks < 0:
-            return []
+    def last_prices (self, symbols, max_workers=1):
+        """Función para consultar el último precio de una lista de activos
+        (símbolo+serie) agrupándolos en el menor número de consultas y
+        devolverlos en un diccionario"""
+
+        # Agrupa los identificadores en lotes, sin repetir los que aparezcan dos veces
+        coins = {}
+        for coin_symbol, series in symbols:
+            coins.setdefault(self.coin_id(coin_symbol), []).append((coin_symbol, series))
+        names = list(coins)
+        batches = [ names[i:i+self.batch_size] for i in range(0, len(names), self.batch_size) ]
+
+        # Consulta un lote y devuelve la respuesta de la API
+        def consult (batch):
+            URL = f"{self.base_url}/simple/price?ids={','.join(batch)}&vs_currencies=mxn"
+            return json.loads(self._get(URL, "last_price", key=','.join(batch)))
+
+        # Cada lote se consulta en un hilo, limitando las consultas simultáneas
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = list(executor.map(consult, batches))
+
+        return { symbol_key : float(response[coin_name]["mxn"])
+                 for response in responses for coin_name in response if coin_name in coins
+                 for symbol_key in coins[coin_name] }
+
+    def _history_url (self, init, end, coin_name):
+        """Genera la URL de la consulta histórica de una moneda"""
+        init_timestamp = int(datetime.combine(init, time.min).timestamp())
+        end_timestamp = int(datetime.combine(end, time.min).timestamp())
+        URL  = f"{self.base_url}/coins/{coin_name}/market_chart/range?"
+        URL += f"vs_currency=mxn&from={init_timestamp}&to={end_timestamp}&precision=2"
+        return URL
 
-        return [init_monday + timedelta(weeks=i) for i in range(weeks + 1)]
+    def _price_chunk (self, init, end, coin_name):
+        """Función para consultar un tramo del histórico y devolver la lista de
+        parejas fecha, precio que reporta la API"""
+        URL = self._history_url(init, end, coin_name)
+        response = json.loads(self._get(URL, "price_history", key=f"{coin_name}|{init}|{end}", permanent=end < date.today()))
+        return [(datetime.utcfromtimestamp(stamp/1000).date(), float(price)) for stamp, price in response["prices"]]
 
-    @staticmethod
-    def _week_list (current_date):
-        """Pequeña función que genera una lista con todos los elementos de la
-        semana de la fecha que se proporciona"""
+    def _chunks (self, init, end):
+        """Divide el rango de fechas en tramos consecutivos de a lo más
+        chunk_days días y al menos min_chunk_days días"""
 
-        current_monday = current_date - timedelta(days=current_date.weekday())
-        current_week   = [current_monday + timedelta(days=i) for i in range(7)]
+        # Un rango corto se extiende hacia atrás y se consulta en un solo tramo
+        days = (end - init).days
+        if days < self.min_chunk_days:
+            return [(end - timedelta(days=self.min_chunk_days), end)]
 
-        return current_week
+        # Reparte el rango en el menor número de tramos de tamaño similar
+        count = -(-days // self.chunk_days)
+        bounds = [init + timedelta(days=days * i // count) for i in range(count + 1)]
 
-    def last_price (self, coin_name):
-        """Función para consulta el último precio registrado en la plataforma y
-        devolverlo como float"""
-        URL = f"https://api.coingecko.com/api/v3/simple/price?ids={coin_name}&vs_currencies=mxn"
-        req = requests.get(URL)
-        response = json.loads(req.text)
-        return float(response[coin_name]["mxn"])
+        return list(zip(bounds[:-1], bounds[1:]))
 
     def price_history (self, init, end, coin_name):
         """Función para consultar los históricos y devolver un diccionario con
         las fechas de interés"""
         if end == init:
             return {}
-        init_timestamp = int(datetime.combine(init, time.min).timestamp())
-        end_timestamp = int(datetime.combine(end, time.min).timestamp())
-        URL  = f"https://api.coingecko.com/api/v3/coins/{coin_name}/market_chart/range?"
-        URL += f"vs_currency=mxn&from={init_timestamp}&to={end_timestamp}&precision=2"
-        req  = requests.get(URL)
-        response = json.loads(req.text)
-        return {datetime.utcfromtimestamp(stamp/1000).date() : float(price)  for stamp, price in response["prices"]}
-
-    def weekly_mean_price_history (self, init, end, coin_name):
-        """Función para consultar los históricos y devolver un diccionario
-        únicamente con las fechas de interés"""
-        mondays = self._mondays_between(init,end)
 
-        if len(mondays) < 0 :
-            return {}
+        # Consulta los tramos del rango en paralelo
+        chunks = self._chunks(init, end)
+        with ThreadPoolExecutor(max_workers=min(self.chunk_workers, len(chunks))) as executor:
+            responses = list(executor.map(lambda chunk: self._price_chunk(*chunk, coin_name), chunks))
 
-        prices = self.price_history(init=mondays[0], end=mondays[-1], coin_name=coin_name)
+        # Une los tramos en orden descartando las fechas repetidas
+        prices = {}
+        for response in responses:
+            for day, price in response:
+                if init <= day <= end:
+                    prices.setdefault(day, price)
 
-        week_mean_prices = {}
-        for monday in mondays:
-            week_dates  = self._week_list(monday)
-            week_prices = [ prices[day] for day in week_dates if day in prices and prices[day] != 0.0 ]
-            mean_price = sum(week_prices)/len(week_prices) if len(week_prices) != 0 else 0.0
-            week_mean_prices[monday] = mean_price
+        return prices
 
-        return week_mean_prices
+    def _history_queries (self, init, end):
+        """Número de consultas que requiere el histórico entre dos fechas"""
 
-    def consult_history_from (self, symbols_dict):
-        """Función para consultar los históricos de una lista de activos
-        (símbolo+serie) desde una fecha de interés. El diccionario tiene como
-        claves símbolo+serie y como valor la fecha desde la cual se debe
-        consultar el precio"""
+        return len(self._chunks(init, end))
 
-        today = date.today()
-
-        return { (coin_symbol, series) : self.weekly_mean_price_history(init_date, today, self._IDs[coin_symbol])
-                 for (coin_symbol, series), init_date in symbols_dict.items() }
+    def iter_price_history (self, init, end, coin_name):
+        """Función para consultar los históricos leyendo las respuestas conforme
+        llegan y devolver las parejas fecha, precio"""
+        if end == init:
+            return
+
+        last_day = None
+        for chunk_init, chunk_end in self._chunks(init, end):
+            URL = self._history_url(chunk_init, chunk_end, coin_name)
+            for stamp, price in transport.iter_elements(self._stream(URL, "price_history"), "prices"):
+                day = datetime.utcfromtimestamp(stamp/1000).date()
+                if init <= day <= end and (last_day is None or day > last_day):
+                    last_day = day
+                    yield day, float(price)
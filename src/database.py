@@ -1,17 +1,94 @@
-import sqlite3
+import csv, sqlite3, threading, itertools
+from bisect import bisect_left
+from contextlib import contextmanager
 from datetime import date, datetime, time, timedelta
+from functools import lru_cache, wraps
+
+def _in_session (method):
+    """Decorador que ejecuta el método dentro de una sesión de la base de datos
+    para que todas sus consultas compartan la misma conexión"""
+
+    @wraps(method)
+    def wrapper (self, *args, **kwargs):
+        with self.session():
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 class FinancialDB:
     """Clase sencilla para el mantenimiento de los datos extraídos por los
     scrappers"""
     db_path = None
+    pragmas = {'journal_mode' : 'WAL', 'synchronous' : 'NORMAL',
+               'cache_size' : -16000, 'mmap_size' : 268435456}
+    csv_columns = {'symbol' : 'Producto', 'serie' : 'Serie', 'date' : 'Fecha',
+                   'status' : 'Status', 'qty' : 'Cantidad', 'price' : 'Costo total'}
 
-    def __init__ (self, filepath):
-        """Constructor que define el nombre del archivo de la base de datos"""
+    def __init__ (self, filepath, pragmas=None, without_rowid=False):
+        """Constructor que define el nombre del archivo de la base de datos y los
+        PRAGMAs que se aplican a cada conexión, y garantiza que el esquema exista"""
     
         # Define la localización de la base de datos cuando se requiera realizar una
         # conexión
         self.db_path = filepath
+    
+        # Combina los PRAGMAs por defecto con los que indique el usuario
+        self.pragmas = {**self.pragmas, **(pragmas or {})}
+    
+        # Cada hilo guarda su propia conexión mientras tenga una sesión abierta
+        self._local = threading.local()
+    
+        # Cache del mapa de productos, se llena en la primera consulta
+        self._products_cache = None
+    
+        # Crea las tablas e índices que falten en la base de datos
+        self.create_schema(without_rowid)
+
+    def _connect (self):
+        """Abre una conexión nueva a la base de datos y le aplica los PRAGMAs
+        configurados"""
+    
+        # Abre la conexión con el archivo de la base de datos
+        conn = sqlite3.connect(self.db_path)
+    
+        # Aplica la configuración, ignorando los PRAGMAs desactivados
+        for pragma, value in self.pragmas.items():
+            if value is not None:
+                conn.execute(f"PRAGMA {pragma}={value}")
+    
+        return conn
+
+    @contextmanager
+    def session (self):
+        """Contexto que mantiene una conexión abierta por hilo para que todas las
+        operaciones dentro de él la reutilicen"""
+    
+        # Si el hilo ya tiene una sesión abierta, simplemente se reutiliza
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+    
+        # En otro caso, se abre la conexión y se registra para el hilo actual
+        conn = self._connect()
+        self._local.conn = conn
+    
+        try:
+            yield conn
+    
+            # Guarda los cambios pendientes al cerrar la sesión
+            conn.commit()
+    
+        except BaseException:
+            # Descarta los cambios si la sesión termina con un error, aun cuando no
+            # sea de SQLite, para no dejar la base de datos bloqueada
+            conn.rollback()
+            raise
+    
+        finally:
+            # Libera la conexión del hilo y la cierra adecuadamente
+            self._local.conn = None
+            conn.close()
 
     def _execute (self, calling_function):
         """Una evoltura para ~execute~ en SQLite. No se requiere toda la potencia de
@@ -19,37 +96,45 @@ class FinancialDB:
         y devuelve el resultado de la consulta para su manipulación posterior"""
     
         try:
-            # Envuelve la posibilidad de fallo en la conexión a base de datos
-            conn = sqlite3.connect(self.db_path)
+            # Envuelve la posibilidad de fallo en la conexión a base de datos usando
+            # la conexión de la sesión en curso o una nueva si no existe
+            with self.session() as conn:
     
-            # Genera un cursor y usa la función para indicar la ejecución que se
-            # desea a través de usar el cursor como parámetro
-            cursor = conn.cursor()
-            calling_function(cursor)
+                # Genera un cursor y usa la función para indicar la ejecución que se
+                # desea a través de usar el cursor como parámetro
+                cursor = conn.cursor()
+                try:
+                    calling_function(cursor)
     
-            # Guarda los posiles cambios realizados a la base de datos
-            conn.commit()
+                    # Guarda los posiles cambios realizados a la base de datos
+                    conn.commit()
     
-            # Extrae la información que coleccionó el cursor de la ejecución
-            return { 'fetched' : cursor.fetchall(),
-                     'rowcount': cursor.rowcount,
-                     'lastrowid': cursor.lastrowid }
+                except sqlite3.Error:
+                    # Descarta los cambios parciales para no contaminar la sesión
+                    conn.rollback()
+                    raise
+    
+                # Extrae la información que coleccionó el cursor de la ejecución
+                return { 'fetched' : cursor.fetchall(),
+                         'rowcount': cursor.rowcount,
+                         'lastrowid': cursor.lastrowid }
     
         except sqlite3.Error as error:
             # Atrapa cualquier error en la ejecución de la base de datos y lo
             # devuelve para informar cuál fue el problema
             return error
-    
-        finally:
-            # Una vez que retorna la función, se garantiza que la conexión se cierra
-            # adecuadamente
-            if conn:
-                conn.close()
 
     def _execute_query (self, query_str, parameters=()):
         """Una evoltura para ~execute_many~ en SQLite para manejar los posibles
         problemas de manera externa"""
     
+        # Si se están revisando los planes de ejecución, se registra el plan de la
+        # consulta antes de ejecutarla
+        plans = getattr(self._local, 'plans', None)
+        if plans is not None:
+            plan = self._execute(lambda cur: cur.execute("EXPLAIN QUERY PLAN " + query_str, parameters))
+            plans.append((query_str, [detail for _, _, _, detail in plan["fetched"]]))
+    
         # Indica cómo debe llamarse a execute usando el cursor cuando esté
         # disponible al conectarse a la base de datos
         return self._execute(lambda cur: cur.execute(query_str, parameters))
@@ -62,19 +147,50 @@ class FinancialDB:
         # disponible al conectarse a la base de datos
         return self._execute(lambda cur: cur.executemany(query_str, parameters))
 
+    def _products_map (self):
+        """Devuelve el mapa de productos en ambas direcciones usando el cache en
+        memoria mientras la tabla de productos no haya cambiado"""
+    
+        with self.session():
+            # Si el contador de cambios es el mismo, el cache sigue siendo válido;
+            # se lee antes que los productos para que un cambio intermedio sólo
+            # provoque otra consulta
+            version = self._execute_query("SELECT version FROM products_version WHERE id = 0")["fetched"][0][0]
+            cache = self._products_cache
+            if cache is not None and cache["version"] == version:
+                return cache
+    
+            # Define una query para traer los IDs requeridos, el origen y la sección
+            # de cada producto
+            SQL_QUERY = "SELECT id, symbol, serie, src, secc FROM products"
+    
+            # Ejecuta la query en la base de datos
+            result = self._execute_query(SQL_QUERY)
+    
+        # Genera los diccionarios en ambas direcciones y los guarda en el cache
+        self._products_cache = {
+            "version" : version,
+            "ids" : { (symbol, serie) : db_id for db_id, symbol, serie, _, _ in result["fetched"]},
+            "symbols" : { db_id : (symbol, serie) for db_id, symbol, serie, _, _ in result["fetched"]},
+            "sources" : { (symbol, serie) : src for _, symbol, serie, src, _ in result["fetched"]},
+            "sections" : { (symbol, serie) : secc for _, symbol, serie, _, secc in result["fetched"]}}
+    
+        return self._products_cache
+
     def _symbols_ids (self):
         """La función cumple una función auxiliar, hace una consulta de los IDs
         correspondientes con los productos registrados. El uso principal se da
         cuando deben insertarse datos nuevos en las tablas que compras y precios"""
     
-        # Define una query para traer los IDs requeridos
-        SQL_QUERY = "SELECT id, symbol, serie FROM products"
-    
-        # Ejecuta la query en la base de datos
-        result = self._execute_query(SQL_QUERY)
+        # Devuelve el diccionario de symbol+serie a ID
+        return self._products_map()["ids"]
+
+    def _ids_symbols (self):
+        """Devuelve el diccionario de ID a symbol+serie de los productos
+        registrados"""
     
-        # Genera un diccionario para devolver el ID
-        return { (symbol, serie) : db_id for db_id, symbol, serie in result["fetched"]}
+        # Devuelve el diccionario de ID a symbol+serie
+        return self._products_map()["symbols"]
 
     @staticmethod
     def _utc2date(utc_timestamp):
@@ -84,6 +200,100 @@ class FinancialDB:
     def _date2utc(given_date):
         return int(datetime.combine(given_date, time.min).timestamp())
 
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def _isodate2utc(date_str):
+        """Convierte una fecha %Y-%m-%d en el entero UTC con el que se guarda"""
+    
+        return int(datetime.strptime(date_str, "%Y-%m-%d").timestamp())
+
+    @staticmethod
+    def _value_before(dates, values, given_date, default=0.0):
+        """Dadas dos listas alineadas de fechas ordenadas y valores, devuelve el
+        valor de la última fecha estrictamente anterior a la fecha dada o el valor
+        por defecto si no existe"""
+    
+        # Busca la posición donde se insertaría la fecha, la anterior es la buscada
+        position = bisect_left(dates, given_date)
+    
+        return values[position-1] if position != 0 else default
+
+    @staticmethod
+    def _periods(given_date):
+        """Devuelve un diccionario con el primer y el último día de la semana y del
+        mes de la fecha dada, con la resolución como clave"""
+    
+        monday = given_date - timedelta(days=given_date.weekday())
+        first_day = given_date.replace(day=1)
+        next_month = (first_day + timedelta(days=32)).replace(day=1)
+    
+        return { "weekly" : (monday, monday + timedelta(days=6)),
+                 "monthly" : (first_day, next_month - timedelta(days=1)) }
+
+    @staticmethod
+    def _price_query(resolution, placeholders):
+        """Devuelve la instrucción que consulta las filas (ID, fecha UTC, precio)
+        de la resolución indicada y los parámetros que preceden a los IDs"""
+    
+        if resolution is None:
+            return f"""SELECT prices.symbol, prices.date, prices.price FROM prices
+            WHERE prices.symbol IN ({placeholders})
+            AND prices.date >= ? AND prices.date <= ?
+            ORDER BY prices.date""", []
+    
+        if resolution == "daily":
+            return f"""SELECT daily_prices.symbol, daily_prices.date, daily_prices.price FROM daily_prices
+            WHERE daily_prices.symbol IN ({placeholders})
+            AND daily_prices.date >= ? AND daily_prices.date <= ?
+            ORDER BY daily_prices.date""", []
+    
+        if resolution in ("weekly", "monthly"):
+            return f"""SELECT price_rollups.symbol, price_rollups.period, price_rollups.total/price_rollups.count
+            FROM price_rollups
+            WHERE price_rollups.resolution = ? AND price_rollups.symbol IN ({placeholders})
+            AND price_rollups.period >= ? AND price_rollups.period <= ?
+            ORDER BY price_rollups.period""", [resolution]
+    
+        raise ValueError(f"Resolución desconocida {resolution!r}, se esperaba None, 'daily', 'weekly' o 'monthly'")
+
+    @staticmethod
+    def _group_columns(symbols_list, symbols_dictionary, rows):
+        """Agrupa filas (ID, fecha UTC, valor) ordenadas por fecha en arreglos de
+        NumPy por símbolo sin convertir las fechas"""
+    
+        # NumPy sólo se requiere en el modo columnar
+        import numpy as np
+    
+        # Todos los símbolos solicitados aparecen aunque no tengan filas
+        columns = { key_pair : {"dates" : np.empty(0, dtype=np.int64), "values" : np.empty(0)}
+                    for key_pair in symbols_list}
+        if len(rows) == 0:
+            return columns
+    
+        # Convierte las filas en columnas
+        table = np.array(rows, dtype=np.float64)
+        ids = table[:,0].astype(np.int64)
+        dates = table[:,1].astype(np.int64)
+        values = table[:,2]
+    
+        # Ordena por símbolo conservando el orden de las fechas y corta por símbolo
+        order = np.argsort(ids, kind="stable")
+        unique_ids, starts = np.unique(ids[order], return_index=True)
+        for symbol_id, indexes in zip(unique_ids, np.split(order, starts[1:])):
+            columns[symbols_dictionary[int(symbol_id)]] = {"dates" : dates[indexes], "values" : values[indexes]}
+    
+        return columns
+
+    @staticmethod
+    def utc2datetime64(utc_dates):
+        """Convierte un arreglo de fechas UTC en enteros a fechas de NumPy"""
+    
+        # NumPy sólo se requiere en el modo columnar
+        import numpy as np
+    
+        return np.asarray(utc_dates, dtype=np.int64).astype("datetime64[s]").astype("datetime64[D]")
+
+    @_in_session
     def consult_scrap_date (self, symbols_list):
         """Dada una lista que describe parejas símbolo+serie, devuelve un
         diccionario usando esa misma pareja como clave y la información que se
@@ -92,12 +302,12 @@ class FinancialDB:
     
         # Define la instrucción requerida en la consulta
         placeholders = ','.join(['?']*len(symbols_list))
-        SQL_QUERY = f"""SELECT products.symbol, products.serie, MAX(prices.date) FROM prices
-        INNER JOIN products ON products.id = prices.symbol
-        WHERE prices.symbol IN ({placeholders}) GROUP BY prices.symbol"""
+        SQL_QUERY = f"""SELECT latest_price.symbol, latest_price.date FROM latest_price
+        WHERE latest_price.symbol IN ({placeholders})"""
     
-        # Atrae el diccionario de IDs para símbolo+serie
+        # Atrae los diccionarios de IDs para símbolo+serie
         ids_dictionary = self._symbols_ids()
+        symbols_dictionary = self._ids_symbols()
     
         # Genera la lista de IDs para ejecutar la operación
         data = [ids_dictionary[key_pair] for key_pair in symbols_list]
@@ -106,9 +316,55 @@ class FinancialDB:
         result = self._execute_query(SQL_QUERY, data)
     
         # Crea el diccionario con la última fecha guardada
-        return { (symbol, serie) : self._utc2date(utc_timestamp)
-                 for symbol, serie, utc_timestamp in result["fetched"]}
+        return { symbols_dictionary[symbol_id] : self._utc2date(utc_timestamp)
+                 for symbol_id, utc_timestamp in result["fetched"]}
+
+    @_in_session
+    def consult_scrap_plan (self, symbols_list, mondays, merge_gap=0):
+        """Dada una lista que describe parejas símbolo+serie y el calendario de
+        lunes que se espera tener guardado, devuelve un diccionario usando esa
+        misma pareja como clave y la lista de rangos (inicio, fin) de lunes
+        consecutivos que faltan en la base de datos"""
+    
+        if len(mondays) == 0:
+            return {}
+    
+        # Define la instrucción requerida en la consulta
+        placeholders = ','.join(['?']*len(symbols_list))
+        SQL_QUERY = f"""SELECT prices.symbol, prices.date FROM prices
+        WHERE prices.symbol IN ({placeholders}) AND prices.date >= ? AND prices.date <= ?"""
+    
+        # Atrae los diccionarios de IDs para símbolo+serie
+        ids_dictionary = self._symbols_ids()
+        symbols_dictionary = self._ids_symbols()
+    
+        # Genera la lista de IDs y el rango del calendario para ejecutar la operación
+        expected = [self._date2utc(monday) for monday in mondays]
+        data = [ids_dictionary[key_pair] for key_pair in symbols_list] + [expected[0], expected[-1]]
+    
+        # Ejecuta la consulta y agrupa las fechas guardadas por símbolo
+        result = self._execute_query(SQL_QUERY, data)
+        stored = { key_pair : set() for key_pair in symbols_list }
+        for symbol_id, utc_timestamp in result["fetched"]:
+            stored[symbols_dictionary[symbol_id]].add(utc_timestamp)
+    
+        # Recorre el calendario uniendo los lunes faltantes en rangos
+        plan = {}
+        for key_pair in symbols_list:
+            ranges = []
+            for position, utc_timestamp in enumerate(expected):
+                if utc_timestamp in stored[key_pair]:
+                    continue
+                if ranges and position - ranges[-1][2] <= merge_gap + 1:
+                    ranges[-1][1:] = [mondays[position], position]
+                else:
+                    ranges.append([mondays[position], mondays[position], position])
+            if ranges:
+                plan[key_pair] = [(init, end) for init, end, _ in ranges]
+    
+        return plan
 
+    @_in_session
     def consult_last_value (self, symbols_list):
         """Dada una lista que describe parejas símbolo+serie, devuelve un
         diccionario usando esa misma pareja como clave y devuelve el último precio
@@ -116,11 +372,14 @@ class FinancialDB:
     
         # Define la instrucción requerida en la consulta
         placeholders = ','.join(['?']*len(symbols_list))
-        SQL_QUERY1 = f"""SELECT symbol, SUM(qty) AS total_qty
-        FROM buys WHERE symbol IN ({placeholders}) GROUP BY symbol"""
+        SQL_QUERY1 = f"""SELECT * FROM (
+            SELECT products.id AS symbol, (SELECT positions.qty FROM positions WHERE positions.symbol = products.id
+                                           ORDER BY positions.date DESC LIMIT 1) AS total_qty
+            FROM products WHERE products.id IN ({placeholders}))
+        WHERE total_qty IS NOT NULL"""
     
-        SQL_QUERY2 = f"""SELECT symbol, price, MAX(date) AS last_date
-        FROM prices WHERE symbol IN ({placeholders}) GROUP BY symbol"""
+        SQL_QUERY2 = f"""SELECT symbol, price, date AS last_date
+        FROM latest_price WHERE symbol IN ({placeholders})"""
     
         FULL_QUERY = f"""WITH total_buys AS ({SQL_QUERY1}), last_prices AS ({SQL_QUERY2})
         SELECT products.symbol, products.serie, total_buys.total_qty*last_prices.price, last_prices.last_date
@@ -141,17 +400,21 @@ class FinancialDB:
         return { (symbol, serie) : {"date" : self._utc2date(utc_timestamp), "value" : value}
                  for symbol, serie, value, utc_timestamp in result["fetched"]}
 
+    @_in_session
     def consult_section_value(self, exclude = []):
         """Consulta en la base de datos el valor acumulado de todos los activos en
         las diferentes secciones registradas en la table de productos a menos que
         sea excluida en la lista"""
     
         # Define la instrucción requerida en la consulta
-        SQL_QUERY1 = f"""SELECT symbol, SUM(qty) AS total_qty
-        FROM buys GROUP BY symbol"""
+        SQL_QUERY1 = f"""SELECT * FROM (
+            SELECT products.id AS symbol, (SELECT positions.qty FROM positions WHERE positions.symbol = products.id
+                                           ORDER BY positions.date DESC LIMIT 1) AS total_qty
+            FROM products)
+        WHERE total_qty IS NOT NULL"""
     
-        SQL_QUERY2 = f"""SELECT symbol, price, MAX(date) AS last_date
-        FROM prices GROUP BY symbol"""
+        SQL_QUERY2 = f"""SELECT symbol, price, date AS last_date
+        FROM latest_price"""
     
         SQL_QUERY3 = f"""SELECT total_buys.symbol AS symbol, total_buys.total_qty*last_prices.price AS value
         FROM total_buys JOIN last_prices ON total_buys.symbol=last_prices.symbol"""
@@ -168,20 +431,22 @@ class FinancialDB:
         return { section : round(last_value,2)
                  for section, last_value in result["fetched"] if section not in exclude}
 
-    def consult_buys_timetable(self, symbols_list, init, end):
+    @_in_session
+    def consult_buys_timetable(self, symbols_list, init, end, columnar=False):
         """Consulta la lista de compras y devuelve un diccionario con las claves de
         los símbolos (symbol+serie) y cada clave tiene asignado otro diccionario con
         las fechas como claves y el gasto del producto en esa fecha"""
     
         # Define la instrucción requerida en la consulta
         placeholders = ','.join(['?']*len(symbols_list))
-        SQL_QUERY = f"""SELECT products.symbol, products.serie, buys.date, buys.price
-        FROM buys JOIN products ON products.id = buys.symbol
+        SQL_QUERY = f"""SELECT buys.symbol, buys.date, buys.price
+        FROM buys
         WHERE buys.symbol IN ({placeholders})
         ORDER BY buys.date"""
     
-        # Atrae el diccionario de IDs para símbolo+serie
+        # Atrae los diccionarios de IDs para símbolo+serie
         ids_dictionary = self._symbols_ids()
+        symbols_dictionary = self._ids_symbols()
     
         # Genera la información para generar la consulta
         data = [ids_dictionary[key_pair] for key_pair in symbols_list]
@@ -189,12 +454,24 @@ class FinancialDB:
         # Ejecuta la consulta y los placeholders deben acumularse
         result = self._execute_query(SQL_QUERY, data)
     
+        # En el modo columnar se separan las compras con arreglos
+        if columnar:
+            utc_init, utc_end = self._date2utc(init), self._date2utc(end)
+            columns = self._group_columns(symbols_list, symbols_dictionary, result["fetched"])
+            symbol_initial_buys = {}
+            for symbol_pair, column in columns.items():
+                dates, costs = column["dates"], column["values"].round(2)
+                symbol_initial_buys[symbol_pair] = float(costs[dates < utc_init].sum())
+                in_range = (dates >= utc_init) & (dates <= utc_end)
+                columns[symbol_pair] = {"dates" : dates[in_range], "values" : costs[in_range]}
+            return columns, symbol_initial_buys
+    
         # Inicializa los calendarios de compras
         symbol_full_timetable = {key_pair: {} for key_pair in symbols_list}
     
         # Agrega por diccionario y por fecha
-        for symbol, serie, utc_date, op_cost in result["fetched"]:
-            key = (symbol,serie)
+        for symbol_id, utc_date, op_cost in result["fetched"]:
+            key = symbols_dictionary[symbol_id]
             current_date = self._utc2date(utc_date)
             symbol_full_timetable[key][current_date] = round(op_cost,2)
     
@@ -212,23 +489,22 @@ class FinancialDB:
         # Devuelve las acciones de compras
         return symbol_corrected_timetable, symbol_initial_buys
 
-    def consult_accumulated_buys_timetable(self, symbols_list, init, end):
+    @_in_session
+    def consult_accumulated_buys_timetable(self, symbols_list, init, end, columnar=False):
         """Consulta la lista de compras y devuelve un diccionario con las claves de
         los símbolos (symbol+serie) y cada clave tiene asignado otro diccionario con
         las fechas como claves y el gasto involucrado hasta esa fecha"""
     
         # Define la instrucción requerida en la consulta
         placeholders = ','.join(['?']*len(symbols_list))
-        SQL_QUERY = f"""SELECT products.symbol, products.serie, buys.date, SUM(buys.price) OVER (
-        PARTITION BY buys.symbol
-        ORDER BY buys.date
-        ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
-        FROM buys JOIN products ON products.id = buys.symbol
-        WHERE buys.symbol IN ({placeholders})
-        ORDER BY buys.date"""
+        SQL_QUERY = f"""SELECT positions.symbol, positions.date, positions.cost
+        FROM positions
+        WHERE positions.symbol IN ({placeholders})
+        ORDER BY positions.date"""
     
-        # Atrae el diccionario de IDs para símbolo+serie
+        # Atrae los diccionarios de IDs para símbolo+serie
         ids_dictionary = self._symbols_ids()
+        symbols_dictionary = self._ids_symbols()
     
         # Genera la información para generar la consulta
         data = [ids_dictionary[key_pair] for key_pair in symbols_list]
@@ -236,12 +512,25 @@ class FinancialDB:
         # Ejecuta la consulta y los placeholders deben acumularse
         result = self._execute_query(SQL_QUERY, data)
     
+        # En el modo columnar el valor inicial es el último acumulado previo
+        if columnar:
+            utc_init, utc_end = self._date2utc(init), self._date2utc(end)
+            columns = self._group_columns(symbols_list, symbols_dictionary, result["fetched"])
+            symbol_initial_buys = {}
+            for symbol_pair, column in columns.items():
+                dates, costs = column["dates"], column["values"].round(2)
+                previous = costs[dates < utc_init]
+                symbol_initial_buys[symbol_pair] = float(previous[-1]) if len(previous) != 0 else 0.0
+                in_range = (dates >= utc_init) & (dates <= utc_end)
+                columns[symbol_pair] = {"dates" : dates[in_range], "values" : costs[in_range]}
+            return columns, symbol_initial_buys
+    
         # Inicializa los calendarios de compras
         symbol_full_timetable = {key_pair: {} for key_pair in symbols_list}
     
         # Agrega por diccionario y por fecha
-        for symbol, serie, utc_date, accumulated_cost in result["fetched"]:
-            key = (symbol,serie)
+        for symbol_id, utc_date, accumulated_cost in result["fetched"]:
+            key = symbols_dictionary[symbol_id]
             current_date = self._utc2date(utc_date)
             symbol_full_timetable[key][current_date] = round(accumulated_cost,2)
     
@@ -251,15 +540,49 @@ class FinancialDB:
     
         # Ajusta las fechas previas al inicio
         for symbol_pair, buy_dates in symbol_full_timetable.items():
-            pre_dates = [date for date in buy_dates.keys() if date < init]
-            symbol_initial_buys[symbol_pair] = 0.0 if len(pre_dates) == 0 else buy_dates[max(pre_dates)]
+            symbol_initial_buys[symbol_pair] = self._value_before(list(buy_dates.keys()), list(buy_dates.values()), init)
             symbol_corrected_timetable[symbol_pair] = { date: value
                                                         for date, value in buy_dates.items() if date >= init and date <= end}
     
         # Devuelve las acciones de compra
         return symbol_corrected_timetable, symbol_initial_buys
 
-    def consult_value_history(self, symbols_list, init, end):
+    @_in_session
+    def consult_price_history(self, symbols_list, init, end, resolution="daily", columnar=False):
+        """Consulta los precios guardados de los activos en la lista de símbolos
+        entre dos fechas en la resolución indicada y devuelve un diccionario con
+        los símbolos como claves y como datos otro diccionario con las fechas y el
+        precio en esa fecha"""
+    
+        # Define la instrucción requerida en la consulta
+        placeholders = ','.join(['?']*len(symbols_list))
+        SQL_QUERY, parameters = self._price_query(resolution, placeholders)
+    
+        # Atrae los diccionarios de IDs para símbolo+serie
+        ids_dictionary = self._symbols_ids()
+        symbols_dictionary = self._ids_symbols()
+    
+        # Recorre el inicio al primer día de su periodo
+        if resolution in ("weekly", "monthly"):
+            init = self._periods(init)[resolution][0]
+    
+        # Genera la información para generar la consulta
+        data = parameters + [ids_dictionary[key_pair] for key_pair in symbols_list]
+        result = self._execute_query(SQL_QUERY, data + [self._date2utc(init), self._date2utc(end)])
+    
+        # En el modo columnar se separan los precios con arreglos
+        if columnar:
+            return self._group_columns(symbols_list, symbols_dictionary, result["fetched"])
+    
+        # Agrega por diccionario y por fecha
+        symbol_prices = { key_pair : {} for key_pair in symbols_list}
+        for symbol_id, utc_date, price in result["fetched"]:
+            symbol_prices[symbols_dictionary[symbol_id]][self._utc2date(utc_date)] = price
+    
+        return symbol_prices
+
+    @_in_session
+    def consult_value_history(self, symbols_list, init, end, columnar=False, resolution=None):
         """Consulta los precios registrados de los activos en la lista de símbolos y
         también la cantidad acumulada del producto, y calula el valor del producto
         en esas fechas. Luego devuelve un diccionario con los símbolos como claves y
@@ -268,72 +591,95 @@ class FinancialDB:
     
         # Define la instrucción requerida en la consulta
         placeholders = ','.join(['?']*len(symbols_list))
-        SQL_QUERY1 = f"""SELECT products.symbol, products.serie, buys.date, SUM(buys.qty) OVER (
-        PARTITION BY buys.symbol
-        ORDER BY buys.date
-        ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
-        FROM buys
-        JOIN products ON products.id = buys.symbol
-        WHERE buys.symbol IN ({placeholders})
-        ORDER BY buys.date"""
+        SQL_QUERY1 = f"""SELECT positions.symbol, positions.date, positions.qty
+        FROM positions
+        WHERE positions.symbol IN ({placeholders})
+        ORDER BY positions.date"""
     
-        SQL_QUERY2 = f"""SELECT products.symbol, products.serie, prices.date, prices.price FROM prices
-        JOIN products ON products.id = prices.symbol
-        WHERE prices.symbol IN ({placeholders})
-        AND prices.date >= ? AND prices.date <= ?
-        ORDER BY prices.date"""
+        SQL_QUERY2, parameters = self._price_query(resolution, placeholders)
     
-        # Atrae el diccionario de IDs para símbolo+serie
+        SQL_VALUES = f"""SELECT weekly_values.symbol, weekly_values.date, weekly_values.value
+        FROM weekly_values
+        WHERE weekly_values.symbol IN ({placeholders})
+        AND weekly_values.date >= ? AND weekly_values.date <= ?
+        ORDER BY weekly_values.symbol, weekly_values.date"""
+    
+        # Atrae los diccionarios de IDs para símbolo+serie
         ids_dictionary = self._symbols_ids()
+        symbols_dictionary = self._ids_symbols()
     
         # Genera la información para generar la consulta
         data = [ids_dictionary[key_pair] for key_pair in symbols_list]
     
-        # Genera las fechas de consulta bajo las fechas dadas
-        init_monday = init - timedelta(days = init.weekday())
-        utc_init, utc_end = self._date2utc(init_monday), self._date2utc(end)
-    
-        # Ejecuta la consulta y los placeholders de la primera query
+        # Genera las fechas de consulta bajo las fechas dadas, los promedios
+        # empiezan en el primer día de su periodo (el lunes para los semanales)
+        period = "weekly" if resolution is None else resolution
+        init_period = init if period == "daily" else self._periods(init)[period][0]
+        utc_init, utc_end = self._date2utc(init_period), self._date2utc(end)
+    
+        # Los valores semanales ya están calculados, basta leer el rango
+        if resolution is None:
+            result = self._execute_query(SQL_VALUES, data + [utc_init, utc_end])
+            if columnar:
+                return self._group_columns(symbols_list, symbols_dictionary, result["fetched"])
+            symbol_values = { key_pair : {} for key_pair in symbols_list}
+            for symbol_id, utc_date, value in result["fetched"]:
+                symbol_values[symbols_dictionary[symbol_id]][self._utc2date(utc_date)] = value
+            return symbol_values
+    
+        # Ejecuta las consultas con los placeholders de cada query
         result1 = self._execute_query(SQL_QUERY1, data)
+        result2 = self._execute_query(SQL_QUERY2, parameters + data + [utc_init, utc_end])
+    
+        # En el modo columnar se calcula el valor con arreglos
+        if columnar:
+            import numpy as np
+            buys = self._group_columns(symbols_list, symbols_dictionary, result1["fetched"])
+            symbol_values = self._group_columns(symbols_list, symbols_dictionary, result2["fetched"])
+            for symbol_key, prices in symbol_values.items():
+                # La posición de la última compra anterior a cada precio, con un
+                # cero al inicio para los precios previos a cualquier compra
+                positions = np.searchsorted(buys[symbol_key]["dates"], prices["dates"], side="left")
+                qtys = np.concatenate(([0.0], buys[symbol_key]["values"]))[positions]
+                prices["values"] = prices["values"] * qtys
+            return symbol_values
     
         # Inicializa diccionario para capturar información
         symbol_timetable = { key_pair : {} for key_pair in symbols_list}
     
         # Recupera la información de la consulta
-        for symbol, serie, utc_date, acc_qty in result1["fetched"]:
-            symbol_key = (symbol, serie)
+        for symbol_id, utc_date, acc_qty in result1["fetched"]:
+            symbol_key = symbols_dictionary[symbol_id]
             symbol_timetable[symbol_key][self._utc2date(utc_date)] = acc_qty
     
-        # Ejecuta la consulta y los placeholders de la primera query
-        result2 = self._execute_query(SQL_QUERY2, data + [utc_init, utc_end])
-    
         # Inicializa diccionario para capturar información
         symbol_values = { key_pair : {} for key_pair in symbols_list}
     
+        # Separa las fechas y cantidades ordenadas de cada símbolo para buscarlas
+        symbol_buy_dates = { key_pair : (list(timetable.keys()), list(timetable.values()))
+                             for key_pair, timetable in symbol_timetable.items()}
+    
         # Recupera la información de la consulta
-        for symbol, serie, utc_date, price in result2["fetched"]:
-            symbol_key = (symbol, serie)
+        for symbol_id, utc_date, price in result2["fetched"]:
+            symbol_key = symbols_dictionary[symbol_id]
             price_date = self._utc2date(utc_date)
-            viable_buy_dates = [ buy_date for buy_date in symbol_timetable[symbol_key].keys() if buy_date < price_date]
-            if len(viable_buy_dates) == 0:
-                qty = 0.0
-            else:
-                buy_date = max(viable_buy_dates)
-                qty = symbol_timetable[symbol_key][buy_date]
+            buy_dates, buy_qtys = symbol_buy_dates[symbol_key]
+            qty = self._value_before(buy_dates, buy_qtys, price_date)
             symbol_values[symbol_key][price_date] =  price * qty
     
         # Devuelve la información recolectada
         return symbol_values
 
+    @_in_session
     def consult_section_symbols(self, section_str):
         """Dado el nombre de una sección, devuelve las claves de los productos que
         pertenecen a ésta"""
     
         # Define la instrucción requerida en la consulta
-        SQL_QUERY = """SELECT products.symbol, products.serie FROM buys
-        JOIN products ON products.id = buys.symbol
+        SQL_QUERY = """SELECT products.symbol, products.serie FROM products
         WHERE products.secc = ?
-        GROUP BY buys.symbol HAVING SUM(buys.qty) > 0"""
+        AND (SELECT positions.qty FROM positions WHERE positions.symbol = products.id
+             ORDER BY positions.date DESC LIMIT 1) > 0"""
     
         # Ejecuta la consulta y los placeholders deben acumularse
         result = self._execute_query(SQL_QUERY, [section_str])
@@ -341,6 +687,31 @@ class FinancialDB:
         # Devuelve directamente la lista con la claves
         return result["fetched"]
 
+    @_in_session
+    def consult_symbols_sources (self, symbols_list=None):
+        """Dada una lista que describe parejas símbolo+serie, devuelve un
+        diccionario usando esa misma pareja como clave y el origen del producto"""
+    
+        # Atrae el diccionario de orígenes para symbol+serie
+        sources_dictionary = self._products_map()["sources"]
+        if symbols_list is None:
+            return dict(sources_dictionary)
+    
+        return { key_pair : sources_dictionary[key_pair] for key_pair in symbols_list }
+
+    @_in_session
+    def consult_symbols_sections (self, symbols_list=None):
+        """Dada una lista que describe parejas símbolo+serie, devuelve un
+        diccionario usando esa misma pareja como clave y la sección del producto"""
+    
+        # Atrae el diccionario de secciones para symbol+serie
+        sections_dictionary = self._products_map()["sections"]
+        if symbols_list is None:
+            return dict(sections_dictionary)
+    
+        return { key_pair : sections_dictionary[key_pair] for key_pair in symbols_list }
+
+    @_in_session
     def recent_full_value_history(self, symbols_list):
         """Usando la lista de símbolos, se genera la historia de valores y compras
         de cada producto. La idea es coleccionar toda la información necesaría para
@@ -361,6 +732,155 @@ class FinancialDB:
         return values, buys, initial
     
 
+    def create_schema (self, without_rowid=False):
+        """Crea las tablas e índices que falten y actualiza la versión del esquema
+        guardada en la base de datos"""
+    
+        with self.session():
+            # Consulta la versión del esquema guardada en la base de datos
+            version = self._execute_query("PRAGMA user_version")["fetched"][0][0]
+    
+            # Versión 1: Crea las tablas
+            if version < 1:
+                tables = SCHEMA_CLUSTERED_TABLES if without_rowid else SCHEMA_TABLES
+                for statement in tables:
+                    self._execute_query(statement)
+    
+            # Versión 2: Crea los índices que cubren las consultas frecuentes
+            if version < 2:
+                for table, statement in SCHEMA_INDEXES.items():
+                    if not self._is_clustered(table):
+                        self._execute_query(statement)
+    
+            # Versión 3: Crea las tablas de precios diarios y sus agregados
+            if version < 3:
+                for statement in SCHEMA_DAILY_TABLES:
+                    self._execute_query(statement)
+    
+            # Versión 4: Crea el libro de posiciones y lo llena con las compras
+            if version < 4:
+                for statement in SCHEMA_LEDGER_TABLES:
+                    self._execute_query(statement)
+                first_buys = self._execute_query("SELECT symbol, MIN(date) FROM buys GROUP BY symbol")["fetched"]
+                self._execute(lambda cur: self._refresh_positions(cur, dict(first_buys)))
+    
+            # Versión 5: Crea la tabla de últimos precios y la llena
+            if version < 5:
+                for statement in SCHEMA_LATEST_TABLES:
+                    self._execute_query(statement)
+                symbol_ids = [symbol_id for symbol_id, in self._execute_query("SELECT id FROM products")["fetched"]]
+                self._execute(lambda cur: self._refresh_latest_prices(cur, symbol_ids))
+    
+            # Versión 6: Crea la tabla de valores semanales y la llena
+            if version < 6:
+                for statement in SCHEMA_VALUE_TABLES:
+                    self._execute_query(statement)
+                ranges = self._execute_query("SELECT symbol, MIN(date), MAX(date) FROM prices GROUP BY symbol")["fetched"]
+                self._execute(lambda cur: self._refresh_weekly_values(cur, ranges))
+    
+            # Versión 7: Crea el contador de cambios de los productos y sus triggers
+            if version < 7:
+                for statement in SCHEMA_PRODUCTS_VERSION:
+                    self._execute_query(statement)
+    
+            # Versión 8: Crea el índice de secciones
+            if version < 8:
+                self._execute_query(SCHEMA_SECTION_INDEX)
+    
+            # Versión 9: Reconstruye las tablas sin restricción de unicidad
+            if version < 9:
+                rebuilt = [table for table in SCHEMA_UNIQUE if self._rebuild_table(table)]
+                if rebuilt:
+                    first_buys = self._execute_query("SELECT symbol, MIN(date) FROM buys GROUP BY symbol")["fetched"]
+                    symbol_ids = [symbol_id for symbol_id, in self._execute_query("SELECT id FROM products")["fetched"]]
+                    ranges = self._execute_query("SELECT symbol, MIN(date), MAX(date) FROM prices GROUP BY symbol")["fetched"]
+                    self._execute(lambda cur: self._refresh_positions(cur, dict(first_buys)))
+                    self._execute(lambda cur: self._refresh_latest_prices(cur, symbol_ids))
+                    self._execute(lambda cur: self._refresh_weekly_values(cur, ranges))
+    
+            # Guarda la versión del esquema
+            return self._execute_query(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _is_clustered (self, table):
+        """Indica si la tabla fue creada sin rowid"""
+    
+        # Consulta la definición de la tabla
+        SQL_QUERY = "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?"
+        result = self._execute_query(SQL_QUERY, [table])
+    
+        return "WITHOUT ROWID" in result["fetched"][0][0].upper()
+
+    def _rebuild_table (self, table):
+        """Reconstruye la tabla con su restricción de unicidad si no la tiene,
+        conservando la primera de las filas repetidas, e indica si lo hizo"""
+    
+        statement, unique_columns = SCHEMA_UNIQUE[table]
+    
+        # Revisa los índices únicos de la tabla
+        for _, index, unique, *_ in self._execute_query(f"PRAGMA index_list({table})")["fetched"]:
+            columns = {column for _, _, column in self._execute_query(f"PRAGMA index_info({index})")["fetched"]}
+            if unique and columns == unique_columns:
+                return False
+    
+        # Copia las filas a la tabla nueva y la pone en lugar de la anterior
+        columns = ", ".join(column for _, column, *_ in self._execute_query(f"PRAGMA table_info({table})")["fetched"]
+                            if column != "id")
+        self._execute_query(statement.replace(f"EXISTS {table} (", f"EXISTS {table}_rebuilt ("))
+        self._execute_query(f"INSERT OR IGNORE INTO {table}_rebuilt({columns}) SELECT {columns} FROM {table} ORDER BY rowid")
+        self._execute_query(f"DROP TABLE {table}")
+        self._execute_query(f"ALTER TABLE {table}_rebuilt RENAME TO {table}")
+        self._execute_query(SCHEMA_INDEXES[table])
+        return True
+
+    def check_query_plans (self, init=None, end=None):
+        """Ejecuta las consultas consult_* registrando su plan de ejecución y
+        devuelve por método los pasos que recorren por completo alguna tabla"""
+    
+        # Define el rango de fechas de las consultas
+        end = date.today() if end is None else end
+        init = end - timedelta(weeks=30) if init is None else init
+    
+        with self.session():
+            # Usa todos los productos y la primera sección registrada
+            symbols_list = list(self._symbols_ids().keys())
+            sections = self._execute_query("SELECT secc FROM products LIMIT 1")["fetched"]
+            section = sections[0][0] if len(sections) != 0 else ""
+    
+            # Sólo se reportan las tablas, no las subconsultas ni las tablas
+            # temporales de las expresiones WITH
+            tables = { name for name, in self._execute_query("SELECT name FROM sqlite_master WHERE type = 'table'")["fetched"] }
+    
+            # Define las llamadas a revisar
+            consults = {
+                "consult_scrap_date" : lambda: self.consult_scrap_date(symbols_list),
+                "consult_last_value" : lambda: self.consult_last_value(symbols_list),
+                "consult_section_value" : lambda: self.consult_section_value(),
+                "consult_buys_timetable" : lambda: self.consult_buys_timetable(symbols_list, init, end),
+                "consult_accumulated_buys_timetable" : lambda: self.consult_accumulated_buys_timetable(symbols_list, init, end),
+                "consult_price_history" : lambda: self.consult_price_history(symbols_list, init, end),
+                "consult_value_history" : lambda: self.consult_value_history(symbols_list, init, end),
+                "consult_section_symbols" : lambda: self.consult_section_symbols(section)}
+    
+            # Ejecuta cada consulta registrando los planes
+            full_scans = {}
+            for name, consult in consults.items():
+                self._local.plans = []
+                try:
+                    consult()
+                    plans = self._local.plans
+                finally:
+                    self._local.plans = None
+    
+                # Cualquier SCAN de una tabla la recorre completa, aunque sea a
+                # través de un índice; sólo SEARCH es un acceso por índice
+                full_scans[name] = [ (query_str, detail)
+                                     for query_str, details in plans
+                                     for detail in details
+                                     if detail.startswith("SCAN ") and detail.split()[1] in tables]
+    
+        return full_scans
+
+    @_in_session
     def bulk_insert_product(self, data_table, start_row=1):
         """Para una tabla con la información relevante, inserta cada fila en masa
         dentro de la base de datos. Esto se considegu
@@ -377,6 +897,7 @@ class FinancialDB:
             insert_row = (symbol, serie, source, current_section)
             data.append(insert_row)
     
+        # Inserta los productos; los triggers invalidan el cache del mapa
         return self._execute_many(SQL_INSERT, data)
 
     @staticmethod
@@ -388,41 +909,139 @@ class FinancialDB:
          proceso se realiza sobre al menos dos tablas de la misma forma antes de
          continuar"""
     
-         # Regenera las filas de tabla, transformando la información que se ingresa
-         return [(str(symbol), str(serie), int(datetime.strptime(date, "%Y-%m-%d").timestamp()), sign*qty, sign*price)
-                 for _, _, symbol, serie, date, status, qty, _, _, _, _, price,_ in data_table[start_row:]
-                 if status == 'DONE']
+         # Regenera las filas de tabla conforme se recorren, transformando la
+         # información que se ingresa
+         parse_date = FinancialDB._isodate2utc
+         return ((str(symbol), str(serie), parse_date(date), sign*qty, sign*price)
+                 for _, _, symbol, serie, date, status, qty, _, _, _, _, price,_ in itertools.islice(data_table, start_row, None)
+                 if status == 'DONE')
 
-    def bulk_insert_buys(self, buys_table, sells_table, start_row=2):
+    @staticmethod
+    def _aggregate_tickets(ids_dictionary, tickets):
+        """Acumula en una sola pasada la cantidad y el costo de los tickets por ID
+        de symbol+serie y fecha"""
+    
+        day_tickets = {}
+        for symbol, serie, utc_timestamp, qty, price in tickets:
+            ticket_key = (ids_dictionary[(symbol,serie)], utc_timestamp)
+            totals = day_tickets.get(ticket_key)
+            if totals is None:
+                day_tickets[ticket_key] = [qty, price]
+            else:
+                totals[0] += qty
+                totals[1] += price
+    
+        return day_tickets
+
+    def _write_buys(self, day_tickets, chunk_size=None):
+        """Guarda las operaciones acumuladas por ID y fecha en transacciones de a
+        lo más chunk_size filas, actualizando el libro de posiciones"""
+    
+        # Define el query requerida para la operación
+        SQL_INSERT = "INSERT OR IGNORE INTO buys(symbol,date,qty,price) VALUES (?,?,?,?)"
+    
+        # Organiza la información acumulada ordenada por símbolo y fecha
+        data = [ (symbol_id, utc_timestamp, qty, price)
+                 for (symbol_id, utc_timestamp), (qty, price) in sorted(day_tickets.items()) ]
+        chunk_size = chunk_size or max(len(data), 1)
+    
+        result = {'fetched' : [], 'rowcount' : 0, 'lastrowid' : None}
+        for position in range(0, max(len(data), 1), chunk_size):
+            chunk = data[position:position+chunk_size]
+    
+            # Anota la primera fecha que cambia en el libro de cada símbolo
+            starts = {}
+            for symbol_id, utc_timestamp, _, _ in chunk:
+                starts.setdefault(symbol_id, utc_timestamp)
+    
+            # Inserta las compras y actualiza las posiciones en una sola
+            # transacción, acumulando el resultado de la inserción
+            def insert (cursor):
+                cursor.executemany(SQL_INSERT, chunk)
+                result["rowcount"] += cursor.rowcount
+                result["lastrowid"] = cursor.lastrowid
+                self._refresh_positions(cursor, starts)
+                self._refresh_weekly_values(cursor, [ (symbol_id, utc_start + 1, MAX_UTC)
+                                                      for symbol_id, utc_start in starts.items() ])
+    
+            chunk_result = self._execute(insert)
+            if not isinstance(chunk_result, dict):
+                return chunk_result
+    
+        return result
+
+    @_in_session
+    def bulk_insert_buys(self, buys_table, sells_table, start_row=2, chunk_size=None):
         """Para una tabla con la información relevante para una compra (si sign=1) o
         una venta (si sign=-1), inserta esa información dentro de la base de datos
         con una potencial modificación: Para insertar una fila con un elemento único
         se requiere símbolo y fecha de compra/venta. Esto quiere decir las filas
         deben acumularse antes de insertarse."""
     
-        # Define el query requerida para la operación
-        SQL_INSERT = "INSERT OR IGNORE INTO buys(symbol,qty,price,date) VALUES (?,?,?,?)"
-    
-        # Extrae los IDs de la base de datos
-        ids_dictionary = self._symbols_ids()
-    
-        # Une los tickets de compra y venta en una lista
-        tickets = self._bulk_op_processing(buys_table, start_row=start_row, sign=1) + self._bulk_op_processing(sells_table, start_row=start_row, sign=-1)
+        # Une los tickets de compra y venta conforme se recorren
+        tickets = itertools.chain(self._bulk_op_processing(buys_table, start_row=start_row, sign=1),
+                                  self._bulk_op_processing(sells_table, start_row=start_row, sign=-1))
     
         # Acumula los valores de compra y venta diarios por symbol+serie+date usando
         # el ID de symbol+serie en la base de datos
-        day_tickets = {}
-        for symbol, serie, utc_timestamp, qty, price in tickets:
-            ticket_key = (ids_dictionary[(symbol,serie)], utc_timestamp)
-            ticket_qty_price = day_tickets.get(ticket_key, (0.0, 0.0))
-            day_tickets[ticket_key] = tuple(a + b for a, b in zip(ticket_qty_price, (qty,price)))
-    
-        # Organiza la información acumulada para insertar la información
-        data = [ (symbol_id, qty, price, utc_timestamp) for (symbol_id, utc_timestamp), (qty, price) in day_tickets.items() ]
+        day_tickets = self._aggregate_tickets(self._symbols_ids(), tickets)
     
-        # Devuelve el resultado de ejecutar la query
-        return self._execute_many(SQL_INSERT, data)
+        # Devuelve el resultado de guardar las operaciones
+        return self._write_buys(day_tickets, chunk_size)
+
+    @_in_session
+    def bulk_import_buys_csv(self, buys_path, sells_path=None, chunk_size=10000, columns=None, encoding="utf-8", **csv_options):
+        """Importa las operaciones de archivos CSV de compras y ventas leyéndolos
+        fila por fila y las guarda en transacciones de chunk_size filas"""
+    
+        columns = {**self.csv_columns, **(columns or {})}
+    
+        # Genera los tickets de un archivo conforme se lee
+        def tickets (path, sign):
+            with open(path, newline="", encoding=encoding) as csv_file:
+                reader = csv.reader(csv_file, **csv_options)
+                header = next(reader)
+                symbol, serie, day, qty, price = (header.index(columns[field])
+                                                  for field in ("symbol", "serie", "date", "qty", "price"))
+                status = header.index(columns["status"]) if columns["status"] is not None else None
+                for row in reader:
+                    if status is None or row[status] == 'DONE':
+                        yield (row[symbol], row[serie], self._isodate2utc(row[day]),
+                               sign*float(row[qty]), sign*float(row[price]))
+    
+        # Une los tickets de compra y venta conforme se leen
+        paths = [(buys_path, 1)] + ([(sells_path, -1)] if sells_path is not None else [])
+        all_tickets = itertools.chain.from_iterable(tickets(path, sign) for path, sign in paths)
+    
+        # Acumula y guarda las operaciones
+        day_tickets = self._aggregate_tickets(self._symbols_ids(), all_tickets)
+        return self._write_buys(day_tickets, chunk_size)
 
+    @staticmethod
+    def _refresh_positions(cursor, starts):
+        """Recalcula el libro de posiciones de cada símbolo desde la fecha UTC
+        indicada en el diccionario de ID a fecha usando el cursor dado"""
+    
+        # Define los queries requeridos para la operación
+        SQL_DELETE = "DELETE FROM positions WHERE symbol = ? AND date >= ?"
+        SQL_INSERT = """WITH previous AS (
+            SELECT COALESCE(MAX(qty), 0.0) AS qty, COALESCE(MAX(cost), 0.0) AS cost FROM (
+                SELECT qty, cost FROM positions WHERE symbol = ? AND date < ?
+                ORDER BY date DESC LIMIT 1))
+        INSERT INTO positions(symbol,date,qty,cost)
+        SELECT buys.symbol, buys.date,
+               previous.qty + SUM(SUM(buys.qty)) OVER (ORDER BY buys.date),
+               previous.cost + SUM(SUM(buys.price)) OVER (ORDER BY buys.date)
+        FROM buys, previous
+        WHERE buys.symbol = ? AND buys.date >= ?
+        GROUP BY buys.date"""
+    
+        # Borra y recalcula las posiciones de cada símbolo desde su fecha
+        for symbol_id, utc_start in starts.items():
+            cursor.execute(SQL_DELETE, (symbol_id, utc_start))
+            cursor.execute(SQL_INSERT, (symbol_id, utc_start, symbol_id, utc_start))
+
+    @_in_session
     def bulk_insert_prices(self, scraps_dictionary):
         # Define el query requerida para la operación
         SQL_INSERT = "INSERT OR IGNORE INTO prices(symbol,date,price) VALUES (?,?,?)"
@@ -430,9 +1049,204 @@ class FinancialDB:
         # Extrae los IDs de la base de datos
         ids_dictionary = self._symbols_ids()
     
-        # Organiza las inserciones que debe realizarse como tuplas
-        data = [ (ids_dictionary[symbol_key], self._date2utc(date) , price)
-                 for symbol_key, prices_dictionary in scraps_dictionary.items()
-                 for date, price in prices_dictionary.items()]
+        # Organiza las inserciones que debe realizarse como tuplas, generándolas
+        # conforme se insertan para aceptar precios que llegan de un generador, y
+        # anota el rango de fechas de cada símbolo
+        bounds = {}
+        def rows ():
+            for symbol_key, prices in scraps_dictionary.items():
+                symbol_id = ids_dictionary[symbol_key]
+                for day, price in (prices.items() if isinstance(prices, dict) else prices):
+                    utc_timestamp = self._date2utc(day)
+                    first, last = bounds.get(symbol_id, (utc_timestamp, utc_timestamp))
+                    bounds[symbol_id] = (min(first, utc_timestamp), max(last, utc_timestamp))
+                    yield (symbol_id, utc_timestamp, price)
+    
+        # Inserta los precios y actualiza los últimos precios y los valores
+        # semanales en una sola transacción, conservando el resultado de la inserción
+        inserted = {}
+        def insert (cursor):
+            cursor.executemany(SQL_INSERT, rows())
+            inserted.update(rowcount=cursor.rowcount, lastrowid=cursor.lastrowid)
+            self._refresh_latest_prices(cursor, [ids_dictionary[symbol_key] for symbol_key in scraps_dictionary])
+            self._refresh_weekly_values(cursor, [ (symbol_id, first, last) for symbol_id, (first, last) in bounds.items() ],
+                                        replace=False)
+    
+        result = self._execute(insert)
+        if isinstance(result, dict):
+            result.update(inserted)
+    
+        return result
+
+    @staticmethod
+    def _refresh_latest_prices(cursor, symbol_ids):
+        """Actualiza el último precio de cada ID de la lista usando el cursor dado"""
     
-        return self._execute_many(SQL_INSERT, data)
+        # Define el query requerida para la operación
+        SQL_REPLACE = """INSERT OR REPLACE INTO latest_price(symbol,date,price)
+        SELECT prices.symbol, prices.date, prices.price FROM prices
+        WHERE prices.symbol = ? ORDER BY prices.date DESC LIMIT 1"""
+    
+        cursor.executemany(SQL_REPLACE, [(symbol_id,) for symbol_id in set(symbol_ids)])
+
+    @staticmethod
+    def _refresh_weekly_values(cursor, ranges, replace=True):
+        """Calcula los valores semanales de los precios de cada rango (ID, fecha
+        UTC inicial, fecha UTC final) usando el cursor dado; sin replace sólo
+        agrega los que falten"""
+    
+        # Define el query requerida para la operación
+        SQL_INSERT = f"""INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO weekly_values(symbol,date,value)
+        SELECT prices.symbol, prices.date, prices.price * COALESCE(
+            (SELECT positions.qty FROM positions
+             WHERE positions.symbol = prices.symbol AND positions.date < prices.date
+             ORDER BY positions.date DESC LIMIT 1), 0.0)
+        FROM prices
+        WHERE prices.symbol = ? AND prices.date >= ? AND prices.date <= ?"""
+    
+        cursor.executemany(SQL_INSERT, ranges)
+
+    @_in_session
+    def bulk_insert_daily_prices(self, scraps_dictionary):
+        """Guarda los precios diarios de un diccionario de símbolos y actualiza los
+        agregados semanales y mensuales de los periodos que cambiaron"""
+    
+        # Define los queries requeridos para la operación
+        SQL_INSERT = "INSERT OR IGNORE INTO daily_prices(symbol,date,price) VALUES (?,?,?)"
+        SQL_ROLLUP = """INSERT OR REPLACE INTO price_rollups(symbol,resolution,period,total,count)
+        SELECT ?, ?, ?, SUM(price), COUNT(*) FROM daily_prices
+        WHERE symbol = ? AND date >= ? AND date <= ? AND price != 0
+        HAVING COUNT(*) > 0"""
+    
+        # Extrae los IDs de la base de datos
+        ids_dictionary = self._symbols_ids()
+    
+        # Genera las filas conforme se insertan, anotando los periodos que tocan
+        touched = set()
+        def rows ():
+            for symbol_key, prices in scraps_dictionary.items():
+                symbol_id = ids_dictionary[symbol_key]
+                for day, price in (prices.items() if isinstance(prices, dict) else prices):
+                    touched.add((symbol_id, day - timedelta(days=day.weekday())))
+                    touched.add((symbol_id, day.replace(day=1)))
+                    yield (symbol_id, self._date2utc(day), price)
+    
+        # Recalcula cada periodo tocado, identificado por su primer día (un lunes
+        # que es primero de mes inicia ambos periodos)
+        def rollups ():
+            for symbol_id, day in touched:
+                for resolution, (first, last) in self._periods(day).items():
+                    if first == day:
+                        utc_first = self._date2utc(first)
+                        yield (symbol_id, resolution, utc_first, symbol_id, utc_first, self._date2utc(last))
+    
+        # Inserta los precios y actualiza los agregados en una sola transacción
+        inserted = 0
+        def insert (cursor):
+            nonlocal inserted
+            cursor.executemany(SQL_INSERT, rows())
+            inserted = cursor.rowcount
+            cursor.executemany(SQL_ROLLUP, rollups())
+    
+        result = self._execute(insert)
+        if isinstance(result, dict):
+            result["rowcount"] = inserted
+    
+        return result
+
+SCHEMA_TABLES = ["""CREATE TABLE IF NOT EXISTS products (
+       id INTEGER UNIQUE PRIMARY KEY,
+       symbol TEXT NOT NULL,
+       serie TEXT,
+       src TEXT,
+       secc TEXT,
+       UNIQUE(symbol, serie))""",
+"""CREATE TABLE IF NOT EXISTS prices (
+       id INTEGER UNIQUE PRIMARY KEY,
+       symbol INTEGER NOT NULL,
+       date INTEGER NOT NULL,
+       price REAL NOT NULL,
+       UNIQUE(symbol, date),
+       FOREIGN KEY(symbol) REFERENCES products(id))""",
+"""CREATE TABLE IF NOT EXISTS buys (
+       id INTEGER UNIQUE PRIMARY KEY,
+       symbol INTEGER NOT NULL,
+       qty REAL NOT NULL,
+       price REAL NOT NULL,
+       date INTEGER NOT NULL,
+       UNIQUE(symbol, price, date),
+       FOREIGN KEY(symbol) REFERENCES products(id))"""]
+
+SCHEMA_CLUSTERED_TABLES = [SCHEMA_TABLES[0],
+"""CREATE TABLE IF NOT EXISTS prices (
+       symbol INTEGER NOT NULL,
+       date INTEGER NOT NULL,
+       price REAL NOT NULL,
+       PRIMARY KEY(symbol, date),
+       FOREIGN KEY(symbol) REFERENCES products(id)) WITHOUT ROWID""",
+"""CREATE TABLE IF NOT EXISTS buys (
+       symbol INTEGER NOT NULL,
+       qty REAL NOT NULL,
+       price REAL NOT NULL,
+       date INTEGER NOT NULL,
+       PRIMARY KEY(symbol, date, price),
+       FOREIGN KEY(symbol) REFERENCES products(id)) WITHOUT ROWID"""]
+
+SCHEMA_INDEXES = {
+    "prices" : "CREATE INDEX IF NOT EXISTS prices_symbol_date ON prices(symbol, date, price)",
+    "buys" : "CREATE INDEX IF NOT EXISTS buys_symbol_date ON buys(symbol, date, qty, price)"}
+
+SCHEMA_DAILY_TABLES = ["""CREATE TABLE IF NOT EXISTS daily_prices (
+       symbol INTEGER NOT NULL,
+       date INTEGER NOT NULL,
+       price REAL NOT NULL,
+       PRIMARY KEY(symbol, date),
+       FOREIGN KEY(symbol) REFERENCES products(id)) WITHOUT ROWID""",
+"""CREATE TABLE IF NOT EXISTS price_rollups (
+       symbol INTEGER NOT NULL,
+       resolution TEXT NOT NULL,
+       period INTEGER NOT NULL,
+       total REAL NOT NULL,
+       count INTEGER NOT NULL,
+       PRIMARY KEY(symbol, resolution, period),
+       FOREIGN KEY(symbol) REFERENCES products(id)) WITHOUT ROWID"""]
+
+SCHEMA_LEDGER_TABLES = ["""CREATE TABLE IF NOT EXISTS positions (
+       symbol INTEGER NOT NULL,
+       date INTEGER NOT NULL,
+       qty REAL NOT NULL,
+       cost REAL NOT NULL,
+       PRIMARY KEY(symbol, date),
+       FOREIGN KEY(symbol) REFERENCES products(id)) WITHOUT ROWID"""]
+
+SCHEMA_LATEST_TABLES = ["""CREATE TABLE IF NOT EXISTS latest_price (
+       symbol INTEGER PRIMARY KEY,
+       date INTEGER NOT NULL,
+       price REAL NOT NULL,
+       FOREIGN KEY(symbol) REFERENCES products(id))"""]
+
+SCHEMA_VALUE_TABLES = ["""CREATE TABLE IF NOT EXISTS weekly_values (
+       symbol INTEGER NOT NULL,
+       date INTEGER NOT NULL,
+       value REAL NOT NULL,
+       PRIMARY KEY(symbol, date),
+       FOREIGN KEY(symbol) REFERENCES products(id)) WITHOUT ROWID"""]
+
+MAX_UTC = 2**63 - 1
+
+SCHEMA_PRODUCTS_VERSION = ["""CREATE TABLE IF NOT EXISTS products_version (
+       id INTEGER PRIMARY KEY CHECK (id = 0),
+       version INTEGER NOT NULL)""",
+"INSERT OR IGNORE INTO products_version(id, version) VALUES (0, 0)"] + [
+f"""CREATE TRIGGER IF NOT EXISTS products_{event.lower()} AFTER {event} ON products
+BEGIN
+    UPDATE products_version SET version = version + 1 WHERE id = 0;
+END""" for event in ("INSERT", "UPDATE", "DELETE")]
+
+SCHEMA_SECTION_INDEX = "CREATE INDEX IF NOT EXISTS products_secc ON products(secc)"
+
+SCHEMA_UNIQUE = {
+    "prices" : (SCHEMA_TABLES[1], {"symbol", "date"}),
+    "buys" : (SCHEMA_TABLES[2], {"symbol", "price", "date"})}
+
+SCHEMA_VERSION = 9
@@ -1,90 +1,80 @@
-import requests,json
-from datetime import date, timedelta
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time, timedelta, timezone
+from . import provider, transport
 
-class DataBursatil:
+@provider.register
+class DataBursatil(provider.Provider):
     """Clase muy simple para contactar con la API de DataBursatil"""
-    token = None
+    name = "DataBursatil"
+    rate_limit = (60, 60)
+    batch_size = 20
+    base_url = "https://api.databursatil.com/v2"
+    week_days = 5
+    week_cutoff = 4
+    mean_digits = 2
+    market_hours = (time(8, 30), time(15, 0))
+    market_timezone = timezone(timedelta(hours=-6))
 
-    def __init__ (self, user_token):
-        self.token = user_token
+    def __init__ (self, user_token, session=None, timeout=None, limiter=None, budget=None, cache=None):
+        super().__init__(user_token, session, timeout, limiter, budget, cache)
 
-    @staticmethod
-    def _mondays_between (init, end):
-        """Pequeña función que genera una lista con todos los viernes entre las
-        fechas que se introducen"""
+    def _asset (self, symbol_key):
+        """Traduce una clave símbolo+serie a los argumentos de consulta"""
 
-        days_since_monday_init = init.weekday()
-        init_monday = init - timedelta(days=days_since_monday_init)
+        ticker, series = symbol_key
+        return (ticker, series)
 
-        days_since_monday_end = end.weekday()
-        if days_since_monday_end >= 4:
-            end_monday = end - timedelta(days=days_since_monday_end)
-        else:
-            end_monday = end - timedelta(days=days_since_monday_end + 7)
-
-        weeks = (end_monday - init_monday).days // 7
+    def last_price (self, ticker, series="*"):
+        """Función para consulta el último precio registrado en la plataforma y
+        devolverlo como float"""
+        URL = f"{self.base_url}/cotizaciones?token={self.token}&emisora_serie={ticker+series}&concepto=u&bolsa=bmv"
+        response = json.loads(self._get(URL, "last_price", key=ticker+series))
+        return float(response[ticker+series]["bmv"]["u"])
 
-        if weeks < 0:
-            return []
+    def last_prices (self, symbols, max_workers=1):
+        """Función para consultar el último precio de una lista de activos
+        (símbolo+serie) agrupándolos en el menor número de consultas y
+        devolverlos en un diccionario"""
 
-        return [init_monday + timedelta(weeks=i) for i in range(weeks + 1)]
+        # Agrupa las emisoras en lotes, sin repetir las que aparezcan dos veces
+        emisoras = { ticker+series : (ticker, series) for ticker, series in symbols }
+        names = list(emisoras)
+        batches = [ names[i:i+self.batch_size] for i in range(0, len(names), self.batch_size) ]
 
-    @staticmethod
-    def _week_list (current_date):
-        """Pequeña función que genera una lista con todos los elementos de la
-        semana de la fecha que se proporciona"""
+        # Consulta un lote y devuelve la respuesta de la API
+        def consult (batch):
+            URL = f"{self.base_url}/cotizaciones?token={self.token}&emisora_serie={','.join(batch)}&concepto=u&bolsa=bmv"
+            return json.loads(self._get(URL, "last_price", key=','.join(batch)))
 
-        current_monday = current_date - timedelta(days=current_date.weekday())
-        current_week   = [current_monday + timedelta(days=i) for i in range(5)]
+        # Cada lote se consulta en un hilo, limitando las consultas simultáneas
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = list(executor.map(consult, batches))
 
-        return current_week
+        return { emisoras[name] : float(response[name]["bmv"]["u"])
+                 for response in responses for name in response if name in emisoras }
 
-    def last_price (self, ticker, series="*"):
-        """Función para consulta el último precio registrado en la plataforma y
-        devolverlo como float"""
-        URL = f"https://api.databursatil.com/v2/cotizaciones?token={self.token}&emisora_serie={ticker+series}&concepto=u&bolsa=bmv"
-        req = requests.get(URL)
-        response = json.loads(req.text)
-        return float(response[ticker+series]["bmv"]["u"])
+    def _history_url (self, init, end, ticker, series):
+        """Genera la URL de la consulta histórica de un activo"""
+        URL  =  f"{self.base_url}/historicos?"
+        URL += f"token={self.token}&inicio={init.strftime('%Y-%m-%d')}&final={end.strftime('%Y-%m-%d')}"
+        URL += f"&emisora_serie={ticker+series}"
+        return URL
 
     def price_history (self, init, end, ticker, series="*"):
         """Función para consultar los históricos y devolver un diccionario con
         las fechas de interés"""
         if end == init:
             return {}
-        URL  =  "https://api.databursatil.com/v2/historicos?"
-        URL += f"token={self.token}&inicio={init.strftime('%Y-%m-%d')}&final={end.strftime('%Y-%m-%d')}"
-        URL += f"&emisora_serie={ticker+series}"
-        req  = requests.get(URL)
-        response = json.loads(req.text)
+        URL = self._history_url(init, end, ticker, series)
+        response = json.loads(self._get(URL, "price_history", key=f"{ticker+series}|{init}|{end}", permanent=end < date.today()))
         return {date.fromisoformat(date_str) : float(response[date_str][0]) for date_str in response.keys()}
 
-    def weekly_mean_price_history (self, init, end, ticker, series="*"):
-        """Función para consultar los históricos y devolver un diccionario
-        únicamente con las fechas de interés"""
-        mondays = self._mondays_between(init,end)
-
-        if len(mondays) < 0 :
-            return {}
-
-        prices = self.price_history(init=mondays[0], end=mondays[-1], ticker=ticker, series=series)
-
-        week_mean_prices = {}
-        for monday in mondays:
-            week_dates  = self._week_list(monday)
-            week_prices = [ prices[day] for day in week_dates if day in prices and prices[day] != 0.0 ]
-            mean_price = sum(week_prices)/len(week_prices) if len(week_prices) != 0 else 0.0
-            week_mean_prices[monday] = round(mean_price,2)
-
-        return week_mean_prices
-
-    def consult_history_from (self, symbols_dict):
-        """Función para consultar los históricos de una lista de activos
-        (símbolo+serie) desde una fecha de interés. El diccionario tiene como
-        claves símbolo+serie y como valor la fecha desde la cual se debe
-        consultar el precio"""
-
-        today = date.today()
-
-        return { (ticker, series) : self.weekly_mean_price_history(init_date, today, ticker, series)
-                 for (ticker, series), init_date in symbols_dict.items() }
+    def iter_price_history (self, init, end, ticker, series="*"):
+        """Función para consultar los históricos leyendo la respuesta conforme
+        llega y devolver las parejas fecha, precio"""
+        if end == init:
+            return
+        URL = self._history_url(init, end, ticker, series)
+        for date_str, values in transport.iter_members(self._stream(URL, "price_history")):
+            yield date.fromisoformat(date_str), float(values[0])
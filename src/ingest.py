@@ -0,0 +1,132 @@
+import itertools, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def _peak_rss ():
+    """Devuelve la memoria máxima que ha usado el proceso o None si no puede
+    consultarse"""
+
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _new_stage ():
+    """Crea el registro vacío de una etapa"""
+
+    return {"symbols" : 0, "rows" : 0, "seconds" : 0.0, "rows_per_second" : None, "peak_rss_kb" : None}
+
+def _record (stage, symbols, rows, seconds):
+    """Agrega una operación al registro de una etapa"""
+
+    stage["symbols"] += symbols
+    stage["rows"] += rows
+    stage["seconds"] += seconds
+    stage["rows_per_second"] = stage["rows"] / stage["seconds"] if stage["seconds"] > 0 else None
+    stage["peak_rss_kb"] = _peak_rss()
+
+def _rows (prices, daily=False):
+    """Devuelve el número de precios que se consultaron para un símbolo"""
+
+    return len(prices[0]) if daily else len(prices)
+
+def _fetch (scrapper, symbols_dict, max_workers, stage, failed, daily=False):
+    """Consulta los símbolos en paralelo y devuelve las parejas símbolo,
+    precios conforme terminan"""
+
+    # Consulta un símbolo midiendo el tiempo que toma
+    def consult (symbol_key, since):
+        start = time.perf_counter()
+        options = {"daily" : True} if daily else {}
+        prices = scrapper.consult_history_from({symbol_key : since}, **options)[symbol_key]
+        if daily:
+            prices = (prices, scrapper.weekly_means_from(since, prices))
+        return prices, time.perf_counter() - start
+
+    pending = iter(symbols_dict.items())
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Envía las primeras consultas
+        futures = { executor.submit(consult, symbol_key, since) : symbol_key
+                    for symbol_key, since in itertools.islice(pending, 2 * max_workers) }
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                symbol_key = futures.pop(future)
+                try:
+                    prices, seconds = future.result()
+                except Exception as error:
+                    failed[symbol_key] = error
+                    continue
+                _record(stage, 1, _rows(prices, daily), seconds)
+                yield symbol_key, prices
+
+            # Repone las consultas que terminaron
+            for symbol_key, since in itertools.islice(pending, len(done)):
+                futures[executor.submit(consult, symbol_key, since)] = symbol_key
+
+def _insert (local_db, batch, daily=False):
+    """Guarda un lote de precios y devuelve el resultado o el error"""
+
+    try:
+        if daily:
+            result = local_db.bulk_insert_daily_prices({ symbol_key : prices[0] for symbol_key, prices in batch.items() })
+            if not isinstance(result, dict):
+                return result
+            weekly = local_db.bulk_insert_prices({ symbol_key : prices[1] for symbol_key, prices in batch.items() })
+            if not isinstance(weekly, dict):
+                return weekly
+            return {**weekly, "rowcount" : result["rowcount"] + weekly["rowcount"]}
+        return local_db.bulk_insert_prices(batch)
+    except Exception as error:
+        return error
+
+def _write (local_db, batch, stage, failed, daily=False):
+    """Guarda un lote de precios en una transacción y, si falla, lo reintenta
+    símbolo por símbolo; devuelve el número de filas insertadas"""
+
+    start = time.perf_counter()
+    rows = sum(_rows(prices, daily) for prices in batch.values())
+
+    result = _insert(local_db, batch, daily)
+    if isinstance(result, dict):
+        inserted = result["rowcount"]
+    else:
+        inserted = 0
+        for symbol_key, prices in batch.items():
+            result = _insert(local_db, {symbol_key : prices}, daily)
+            if isinstance(result, dict):
+                inserted += result["rowcount"]
+            else:
+                failed[symbol_key] = result
+
+    _record(stage, len(batch), rows, time.perf_counter() - start)
+    return inserted
+
+def ingest_history (local_db, scrapper, symbols_dict, max_workers=4, commit_size=1000, daily=False):
+    """Consulta los históricos de los símbolos con el scrapper y los guarda en
+    la base de datos conforme llegan, en transacciones de commit_size filas, y
+    devuelve un reporte de la ingesta"""
+
+    start = time.perf_counter()
+    stages = {"fetch" : _new_stage(), "write" : _new_stage()}
+    failed = {}
+    inserted = 0
+
+    # Escribe los lotes conforme se llenan
+    batch, batch_rows = {}, 0
+    for symbol_key, prices in _fetch(scrapper, symbols_dict, max_workers, stages["fetch"], failed, daily):
+        batch[symbol_key] = prices
+        batch_rows += _rows(prices, daily)
+        if batch_rows >= commit_size:
+            inserted += _write(local_db, batch, stages["write"], failed, daily)
+            batch, batch_rows = {}, 0
+
+    # Escribe el último lote incompleto
+    if batch:
+        inserted += _write(local_db, batch, stages["write"], failed, daily)
+
+    return {"inserted" : inserted, "failed" : failed, "seconds" : time.perf_counter() - start, "stages" : stages}
@@ -1,7 +1,7 @@
-import matplotlib.pyplot as plt
-from matplotlib.ticker import FuncFormatter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date, datetime, time, timedelta
-import numpy as np
+import os
+import time as clock
 
 COLORS = ['yellow','green','blue','purple','red']
 
@@ -16,6 +16,8 @@ def _get_next_monday (given_date):
     return given_monday
 
 def _split_list_with (given_list, split_list):
+    """Parte la lista ordenada en los puntos ordenados de split_list en una
+    sola pasada"""
 
     # Revisa un caso extremo: sin puntos no hay corte
     if len(split_list) == 0:
@@ -23,27 +25,29 @@ def _split_list_with (given_list, split_list):
 
     # Iniciando las piezas que resulten
     splitted = []
-
-    # Se indica con cuál lista debe comenzarse
-    splitting = given_list
-
-    # Se usa cada elemento indicado para hacer la partición
-    for split in split_list:
-
-        # Se parte en dos el arreglo en turno
-        left_split = [ x for x in splitting if x <= split]
-        right_split = [ x for x in splitting if x >= split]
-
-        # Y sólo se considera una pieza si no es vacío
-        if len(left_split) != 0:
-            splitted.append(left_split)
-
-        # Se cambia el arreglo que se debe particionar como la segunda parte
-        splitting = right_split
+    piece = []
+    splits = iter(split_list)
+    split = next(splits, None)
+
+    for x in given_list:
+        # Cierra la pieza en turno en cada corte que ya se rebasó
+        while split is not None and x > split:
+            if len(piece) != 0:
+                splitted.append(piece)
+            piece = []
+            split = next(splits, None)
+
+        piece.append(x)
+
+        # Un punto de corte termina una pieza y empieza la siguiente
+        if x == split:
+            splitted.append(piece)
+            piece = [x]
+            split = next(splits, None)
 
     # Al terminar, se agrega el residuo si es no vacío
-    if len(splitting) != 0:
-        splitted.append(splitting)
+    if len(piece) != 0:
+        splitted.append(piece)
 
     # Devuelve las piezas reconocidas
     return splitted
@@ -73,7 +77,24 @@ def _distribute_vertically (pairs_list, threshold = 100):
     # Regresa las modificaciones
     return new_pairs_list
 
+def _as_timetables (symbols_series):
+    """Convierte las series en modo columnar en diccionarios con fechas como
+    claves, dejando intactas las que ya son diccionarios"""
+
+    import numpy as np
+
+    timetables = {}
+    for key, series in symbols_series.items():
+        if isinstance(series.get("dates"), np.ndarray):
+            dates = series["dates"].astype("datetime64[s]").astype("datetime64[D]").astype(object)
+            timetables[key] = dict(zip(dates, series["values"].tolist()))
+        else:
+            timetables[key] = series
+    return timetables
+
 def _plot_basic_settings(fig, ax):
+    from matplotlib.ticker import FuncFormatter
+
     # Configura los elementos base
     fig.set_figwidth(13)
     ax.tick_params(axis='x', colors='white')
@@ -87,13 +108,27 @@ def _plot_basic_settings(fig, ax):
     ax.spines['left'].set_color('white')
     ax.yaxis.set_major_formatter(FuncFormatter(lambda x, pos: f'${x:,.0f}'))
 
-def plot_value_history (symbols_values, buys_timetable={}, save_path = None):
-    """Crea una imagen en archivo indicado con una gráfica que describe la
-    evolución del activo, indicando las compras que se realizaron en ese periodo
-    de tiempo"""
+def _show_or_save (fig, ax, save_path=None):
+    """Muestra la figura con fondo negro o la guarda en el archivo indicado y
+    la cierra"""
 
-    # Crea los objetos que requerimos para la gráfica
-    fig, ax = plt.subplots()
+    import matplotlib.pyplot as plt
+
+    if save_path is None:
+        ax.set_facecolor("black")
+        fig.patch.set_facecolor("black")
+        plt.show()
+    else:
+        fig.savefig(save_path, transparent = True)
+    plt.close(fig)
+
+def _draw_value_history (fig, ax, symbols_values, buys_timetable={}):
+    """Dibuja en los ejes dados una gráfica que describe la evolución del
+    activo, indicando las compras que se realizaron en ese periodo de tiempo"""
+
+    # Acepta las series en modo columnar
+    symbols_values = _as_timetables(symbols_values)
+    buys_timetable = _as_timetables(buys_timetable)
 
     # Configura la gráfica...
     _plot_basic_settings(fig,ax)
@@ -175,20 +210,25 @@ def plot_value_history (symbols_values, buys_timetable={}, save_path = None):
     ax.legend(loc='upper center', bbox_to_anchor=(0.5, 1.1), ncol=6, fancybox=True, framealpha=0.0, labelcolor="white")
     fig.autofmt_xdate()
 
-    # Genera la gráfica
-    if save_path is None:
-        ax.set_facecolor("black")
-        fig.patch.set_facecolor("black")
-        plt.show()
-    else:
-        plt.savefig(save_path, transparent = True)
-    plt.close()
-
-def plot_added_value_history (symbols_values, buys_timetable={}, buys_initial_value=0.0, save_path = None):
+def plot_value_history (symbols_values, buys_timetable={}, save_path = None):
+    """Crea una imagen en archivo indicado con una gráfica que describe la
+    evolución del activo, indicando las compras que se realizaron en ese periodo
+    de tiempo"""
 
     # Crea los objetos que requerimos para la gráfica
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots()
 
+    # Dibuja y genera la gráfica
+    _draw_value_history(fig, ax, symbols_values, buys_timetable)
+    _show_or_save(fig, ax, save_path)
+
+def _draw_added_value_history (fig, ax, symbols_values, buys_timetable={}, buys_initial_value=0.0):
+
+    # Acepta las series en modo columnar
+    symbols_values = _as_timetables(symbols_values)
+    buys_timetable = _as_timetables(buys_timetable)
+
     # Configura la gráfica...
     _plot_basic_settings(fig,ax)
 
@@ -231,8 +271,8 @@ def plot_added_value_history (symbols_values, buys_timetable={}, buys_initial_va
 
     # Usando las fechas de compras, se parten las regiones para indicar los
     # cambios de valor repentinos provocados por una compra
-    x_axis = list(accumulated_value.keys())
-    x_fragments = _split_list_with(x_axis, list(total_buys.keys()))
+    x_axis = sorted(accumulated_value.keys())
+    x_fragments = _split_list_with(x_axis, sorted(total_buys.keys()))
 
     # Se debe coleccionar los valores en el otro eje
     y_fragments = []
@@ -323,11 +363,11 @@ def plot_added_value_history (symbols_values, buys_timetable={}, buys_initial_va
         # Dibuja las etiquetas
         ax.text(x=x_value + timedelta(days=5), y=label_y_position, s=f"{y_value:,.2f}", bbox=dict(facecolor="white"))
 
-    # Agrega información extra
+    # Agrega información extra con la misma ganancia que reporta analytics
+    from .analytics import roe_roi
     current_value = y_fragments[-1][-1]
     buy_value = y_fragments_buys[-1][-1]
-    roe = current_value - buy_value
-    roi = (roe / buy_value)*100
+    roe, roi = roe_roi(current_value, buy_value)
     ax.text(0.0, 1.1, f"ROE: {roe:,.2f}\nROI: {roi:,.2f}%", horizontalalignment='left', verticalalignment='top', transform=ax.transAxes, color="white")
 
     # Ajusta la información a mostrar
@@ -335,42 +375,48 @@ def plot_added_value_history (symbols_values, buys_timetable={}, buys_initial_va
     ax.legend(loc='upper left', bbox_to_anchor=(0.7, 1.1), ncol=2, fancybox=True, framealpha=0.0, labelcolor="white")
     fig.autofmt_xdate()
 
-    # Genera la gráfica
-    if save_path is None:
-        ax.patch.set_facecolor("black")
-        fig.patch.set_facecolor("black")
-        plt.show()
-    else:
-        plt.savefig(save_path, transparent = True)
-    plt.close()
+def plot_added_value_history (symbols_values, buys_timetable={}, buys_initial_value=0.0, save_path = None):
 
-def plot_general_distribution(sections_values, **kwargs):
+    # Crea los objetos que requerimos para la gráfica
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+
+    # Dibuja y genera la gráfica
+    _draw_added_value_history(fig, ax, symbols_values, buys_timetable, buys_initial_value)
+    _show_or_save(fig, ax, save_path)
+
+def _general_labels(sections_values):
 
     # Extrae información
     pair_values = [(section,value) for section, value in sections_values.items() if value != 0.0]
-    labels, data = list(zip(*pair_values))
+    return list(zip(*pair_values))
+
+def plot_general_distribution(sections_values, **kwargs):
 
     # LLama a la gráfica con la información extraída
+    labels, data = _general_labels(sections_values)
     plot_pie_chart(labels, data, **kwargs)
 
-def plot_local_distribution(symbols_values, **kwargs):
+def _local_labels(symbols_values):
 
     #Extra la información relevante
     pair_values = [(symbol, dates_values["value"])
                    for (symbol, _), dates_values in symbols_values.items() if dates_values["value"] != 0.0]
-    labels, data = list(zip(*pair_values))
+    return list(zip(*pair_values))
+
+def plot_local_distribution(symbols_values, **kwargs):
 
     # LLama a la gráfica con la información extraída
+    labels, data = _local_labels(symbols_values)
     plot_pie_chart(labels, data, **kwargs)
 
-def plot_pie_chart (labels, data, save_path=None, angle=-40):
+def _draw_pie_chart (fig, ax, labels, data, angle=-40):
+    import numpy as np
+
 
     # Calcula el total de inversión
     total = sum(data)
 
-    # Define marco y ejes
-    fig, ax = plt.subplots()
-
     # Crea la gráfica de pie
     wedges, texts, pcts = ax.pie(data, radius=1, textprops=dict(color='white',size='smaller'),
                                  wedgeprops=dict(width=0.6, edgecolor='w'), autopct='%.0f%%',
@@ -393,12 +439,87 @@ def plot_pie_chart (labels, data, save_path=None, angle=-40):
         ax.annotate(f"{labels[i]}\n${data[i]:,.2f}", xy=(x, y), xytext=(1.35*np.sign(x), 1.4*y),
                     horizontalalignment=horizontalalignment, **kw)
 
+def plot_pie_chart (labels, data, save_path=None, angle=-40):
 
-    # Genera la gráfica
-    if save_path is None:
-        ax.patch.set_facecolor("black")
-        fig.patch.set_facecolor("black")
-        plt.show()
-    else:
-        plt.savefig(save_path, transparent = True)
-    plt.close()
+    # Define marco y ejes
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+
+    # Dibuja y genera la gráfica
+    _draw_pie_chart(fig, ax, labels, data, angle)
+    _show_or_save(fig, ax, save_path)
+
+def _draw_general_distribution (fig, ax, sections_values, angle=-40):
+    labels, data = _general_labels(sections_values)
+    _draw_pie_chart(fig, ax, labels, data, angle)
+
+def _draw_local_distribution (fig, ax, symbols_values, angle=-40):
+    labels, data = _local_labels(symbols_values)
+    _draw_pie_chart(fig, ax, labels, data, angle)
+
+CHART_KINDS = {
+    "value_history" : _draw_value_history,
+    "added_value_history" : _draw_added_value_history,
+    "general_distribution" : _draw_general_distribution,
+    "local_distribution" : _draw_local_distribution,
+    "pie_chart" : _draw_pie_chart,
+}
+
+_TEMPLATES = {}
+
+def _template (kind):
+    """Devuelve la figura y los ejes limpios de la plantilla de un tipo de
+    gráfica, creándola la primera vez"""
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = _TEMPLATES.get(kind)
+    if fig is None:
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        _TEMPLATES[kind] = fig
+    fig.clear()
+    return fig, fig.add_subplot()
+
+def _render_chart (spec):
+    """Dibuja y guarda una gráfica a partir de su especificación y devuelve su
+    reporte"""
+
+    options = dict(spec)
+    kind, save_path = options.pop("kind", None), options.pop("save_path", None)
+    report = {"kind" : kind, "save_path" : save_path, "seconds" : 0.0, "worker" : os.getpid(), "error" : None}
+
+    start = clock.perf_counter()
+    try:
+        if kind not in CHART_KINDS:
+            raise ValueError(f"Tipo de gráfica desconocido {kind!r}, se esperaba alguno de {tuple(CHART_KINDS)}")
+        if save_path is None:
+            raise ValueError("La generación en lote requiere save_path")
+        fig, ax = _template(kind)
+        CHART_KINDS[kind](fig, ax, **options)
+        fig.savefig(save_path, transparent = True)
+    except Exception as error:
+        report["error"] = error
+    report["seconds"] = clock.perf_counter() - start
+
+    return report
+
+def _init_worker (backend):
+    """Fija el backend de matplotlib en un proceso del lote"""
+
+    import matplotlib
+    matplotlib.use(backend)
+
+def render_charts (specs, max_workers=None, backend="Agg"):
+    """Genera sin interfaz las gráficas de una lista de especificaciones,
+    repartidas en max_workers procesos, y devuelve el reporte de cada una"""
+
+    specs = list(specs)
+    if max_workers == 1 or len(specs) <= 1:
+        return [_render_chart(spec) for spec in specs]
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(specs))
+    chunksize = -(-len(specs) // max_workers)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(backend,)) as executor:
+        return list(executor.map(_render_chart, specs, chunksize=chunksize))
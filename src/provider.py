@@ -0,0 +1,338 @@
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from . import ingest, transport
+
+PROVIDERS = {}
+
+def register (provider_class):
+    """Decorador que registra una clase de proveedor usando su nombre"""
+
+    PROVIDERS[provider_class.name.lower()] = provider_class
+    return provider_class
+
+def provider_for (src):
+    """Devuelve la clase del proveedor registrado para el origen de un
+    producto"""
+
+    # Registra los proveedores incluidos en el paquete
+    from . import coingecko, databursatil
+
+    try:
+        return PROVIDERS[src.strip().lower()]
+    except KeyError:
+        raise KeyError(f"No hay un proveedor registrado para el origen {src!r}") from None
+
+def group_sources (sources, scrappers=None):
+    """Agrupa los símbolos por el origen de sus precios y separa, con el error
+    de cada uno, los que no tienen un proveedor que pueda consultarlos"""
+
+    groups, skipped = {}, {}
+    for symbol_key, src in sources.items():
+        src = (src or "").strip().lower()
+        try:
+            if not src:
+                raise KeyError("El producto no tiene un origen de precios")
+            if src not in (scrappers or {}):
+                provider_for(src)
+        except KeyError as error:
+            skipped.setdefault(src, {})[symbol_key] = error
+        else:
+            groups.setdefault(src, []).append(symbol_key)
+    return groups, skipped
+
+def failed_report (failed):
+    """Devuelve el reporte de una ingesta en la que fallaron todos los
+    símbolos"""
+
+    return {"inserted" : 0, "failed" : failed, "seconds" : 0.0, "stages" : {}}
+
+class Provider:
+    """Clase base de los proveedores de precios con el cálculo de semanas, los
+    promedios semanales y la interacción con la base de datos"""
+    name = None
+    token = None
+    timeout = (5, 30)
+    rate_limit = (60, 60)
+    credit_costs = {"last_price" : 1, "price_history" : 1}
+    cache_ttl = {"last_price" : 60, "price_history" : 3600}
+    batch_size = 20
+    base_url = None
+    week_days = 7
+    week_cutoff = 6
+    mean_digits = None
+    stream_chunk_size = 4096
+    market_hours = None
+    market_timezone = timezone.utc
+    refresh_interval = 6 * 3600
+    refresh_delay = 1800
+
+    def __init__ (self, user_token=None, session=None, timeout=None, limiter=None, budget=None, cache=None):
+        self.token = user_token
+        self.session = transport.build_session() if session is None else session
+        self.timeout = self.timeout if timeout is None else timeout
+        self.limiter = transport.TokenBucket(*self.rate_limit) if limiter is None else limiter
+        self.budget = transport.CreditBudget() if budget is None else budget
+        self.cache = cache
+
+    @classmethod
+    def _mondays_between (cls, init, end):
+        """Pequeña función que genera una lista con todos los lunes entre las
+        fechas que se introducen"""
+
+        days_since_monday_init = init.weekday()
+        init_monday = init - timedelta(days=days_since_monday_init)
+
+        days_since_monday_end = end.weekday()
+        if days_since_monday_end >= cls.week_cutoff:
+            end_monday = end - timedelta(days=days_since_monday_end)
+        else:
+            end_monday = end - timedelta(days=days_since_monday_end + 7)
+
+        weeks = (end_monday - init_monday).days // 7
+
+        if weeks < 0:
+            return []
+
+        return [init_monday + timedelta(weeks=i) for i in range(weeks + 1)]
+
+    @classmethod
+    def _week_list (cls, current_date):
+        """Pequeña función que genera una lista con todos los elementos de la
+        semana de la fecha que se proporciona"""
+
+        current_monday = current_date - timedelta(days=current_date.weekday())
+        current_week   = [current_monday + timedelta(days=i) for i in range(cls.week_days)]
+
+        return current_week
+
+    def _get (self, URL, method, key=None, permanent=False):
+        """Consulta la URL usando la sesión, cargando el costo del método al
+        presupuesto y respetando el límite de consultas, y devuelve el texto de
+        la respuesta. Con una clave, la respuesta se busca y se guarda en el
+        cache"""
+
+        # Busca la respuesta en el cache antes de gastar créditos
+        cached = self.cache is not None and key is not None
+        if cached:
+            key = f"{self.name}|{method}|{key}"
+            body = self.cache.get(key)
+            if body is not None:
+                return body
+
+        self.budget.charge(self.credit_costs[method])
+        self.limiter.acquire()
+        req = self.session.get(URL, timeout=self.timeout)
+
+        # Guarda sólo las respuestas exitosas
+        if cached and req.ok:
+            self.cache.set(key, req.text, None if permanent else self.cache_ttl[method])
+
+        return req.text
+
+    def _stream (self, URL, method, chunk_size=65536):
+        """Consulta la URL usando la sesión, cargando el costo del método al
+        presupuesto y respetando el límite de consultas, y devuelve los bloques
+        de bytes de la respuesta conforme llegan"""
+
+        self.budget.charge(self.credit_costs[method])
+        self.limiter.acquire()
+        with self.session.get(URL, timeout=self.timeout, stream=True) as req:
+            yield from req.iter_content(chunk_size)
+
+    def _asset (self, symbol_key):
+        """Traduce una clave símbolo+serie a los argumentos que identifican al
+        activo en los métodos de consulta"""
+
+        raise NotImplementedError
+
+    def _history_queries (self, init, end):
+        """Número de consultas que requiere el histórico entre dos fechas"""
+
+        return 1
+
+    @staticmethod
+    def _batches (pairs, size):
+        """Divide las parejas fecha, precio de un generador en listas de a lo
+        más size parejas"""
+
+        pairs = iter(pairs)
+        chunk = list(itertools.islice(pairs, size))
+        while chunk:
+            yield chunk
+            chunk = list(itertools.islice(pairs, size))
+
+    def _weekly_means (self, mondays, chunks):
+        """Calcula el promedio semanal de los bloques de parejas fecha, precio
+        para cada lunes de la lista y devuelve las parejas lunes, promedio"""
+
+        from . import resample
+
+        # Acumula las sumas y el número de precios de cada semana por bloque
+        totals = resample.resample_weekly([], [], how="sum", week_days=self.week_days, mondays=mondays)
+        for chunk in chunks:
+            dates, values = resample.from_pairs(chunk)
+            columns = resample.resample_weekly(dates, values, how="sum", week_days=self.week_days, mondays=mondays)
+            totals["sum"] = totals["sum"] + columns["sum"]
+            totals["count"] = totals["count"] + columns["count"]
+
+        for monday, total, count in zip(mondays, totals["sum"].tolist(), totals["count"].tolist()):
+            mean_price = total/count if count != 0 else 0.0
+            yield monday, mean_price if self.mean_digits is None else round(mean_price, self.mean_digits)
+
+    def weekly_mean_price_history (self, init, end, *asset, **options):
+        """Función para consultar los históricos y devolver un diccionario
+        únicamente con las fechas de interés"""
+        mondays = self._mondays_between(init,end)
+
+        if len(mondays) == 0 :
+            return {}
+
+        prices = self.price_history(mondays[0], mondays[-1] + timedelta(days=6), *asset, **options)
+
+        # Agrupa todos los precios en un solo bloque vectorizado
+        return dict(self._weekly_means(mondays, [prices]))
+
+    def iter_weekly_mean_price_history (self, init, end, *asset, **options):
+        """Función para consultar los históricos leyendo las respuestas conforme
+        llegan y devolver las parejas lunes, promedio semanal"""
+        mondays = self._mondays_between(init,end)
+
+        if len(mondays) == 0 :
+            return
+
+        prices = self.iter_price_history(mondays[0], mondays[-1] + timedelta(days=6), *asset, **options)
+
+        yield from self._weekly_means(mondays, self._batches(prices, self.stream_chunk_size))
+
+    def weekly_mean_price_ranges (self, ranges, *asset, **options):
+        """Función para consultar los promedios semanales de una lista de rangos
+        de lunes (inicio y fin incluidos) y unirlos en un solo diccionario"""
+
+        week_mean_prices = {}
+        for init, end in ranges:
+            week_mean_prices.update(self.weekly_mean_price_history(init, end + timedelta(weeks=1), *asset, **options))
+
+        return week_mean_prices
+
+    def _weekly_spans (self, since, end):
+        """Devuelve las listas de lunes que consulta la versión semanal para una
+        fecha o para cada rango de un plan"""
+
+        if isinstance(since, list):
+            return [self._mondays_between(init, last + timedelta(weeks=1)) for init, last in since]
+        return [self._mondays_between(since, end)]
+
+    def weekly_means_from (self, since, prices, end=None):
+        """Calcula con los precios diarios de consult_history_from(daily=True)
+        los promedios semanales que habría devuelto la consulta semanal"""
+
+        end = date.today() if end is None else end
+        mondays = [monday for span in self._weekly_spans(since, end) for monday in span]
+        return dict(self._weekly_means(mondays, [prices])) if mondays else {}
+
+    def consult_history_from (self, symbols_dict, max_workers=1, daily=False):
+        """Función para consultar los históricos de una lista de activos
+        (símbolo+serie) desde una fecha de interés. El diccionario tiene como
+        claves símbolo+serie y como valor la fecha desde la cual se debe
+        consultar el precio o la lista de rangos de lunes que faltan. Las
+        consultas pueden hacerse de manera concurrente con hasta max_workers
+        consultas simultáneas. Con daily se devuelven los precios diarios"""
+
+        today = date.today()
+
+        # Un plan se consulta rango por rango, una fecha se consulta hasta hoy;
+        # los precios diarios cubren las semanas de la consulta semanal
+        def history (since, asset):
+            if daily and isinstance(since, list):
+                prices = {}
+                for mondays in self._weekly_spans(since, today):
+                    if mondays:
+                        prices.update(self.price_history(mondays[0], mondays[-1] + timedelta(days=6), *asset))
+                return prices
+            if daily:
+                return self.price_history(since - timedelta(days=since.weekday()), today, *asset)
+            if isinstance(since, list):
+                return self.weekly_mean_price_ranges(since, *asset)
+            return self.weekly_mean_price_history(since, today, *asset)
+
+        # Cada símbolo se consulta en un hilo, limitando las consultas simultáneas
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = { symbol_key : executor.submit(history, since, self._asset(symbol_key))
+                        for symbol_key, since in symbols_dict.items() }
+
+        return { symbol_key : future.result() for symbol_key, future in futures.items() }
+
+    def plan_history_from (self, local_db, symbols_list, init, merge_gap=0):
+        """Función para generar el plan de consulta de una lista de activos
+        (símbolo+serie): los rangos de lunes desde init que no están guardados
+        en la base de datos"""
+
+        mondays = self._mondays_between(init, date.today())
+        return local_db.consult_scrap_plan(symbols_list, mondays, merge_gap)
+
+    def estimate_history_credits (self, symbols_dict):
+        """Estima sin consultar la API los créditos que gastaría
+        consult_history_from con el mismo diccionario"""
+
+        today = date.today()
+
+        # Cuenta las consultas históricas que requiere cada símbolo
+        def queries (since):
+            if isinstance(since, list):
+                return sum(self._history_queries(init, end + timedelta(days=6)) for init, end in since)
+            mondays = self._mondays_between(since, today)
+            return self._history_queries(mondays[0], mondays[-1] + timedelta(days=6)) if len(mondays) > 0 else 0
+
+        return { symbol_key : queries(since) * self.credit_costs["price_history"]
+                 for symbol_key, since in symbols_dict.items() }
+
+    @classmethod
+    def next_refresh (cls, after):
+        """Devuelve la siguiente fecha y hora en que conviene actualizar los
+        precios del proveedor después de after"""
+
+        if cls.market_hours is None:
+            return after + timedelta(seconds=cls.refresh_interval)
+
+        # Busca el siguiente cierre de un día hábil
+        _, close = cls.market_hours
+        local_date = after.astimezone(cls.market_timezone).date()
+        for days in range(8):
+            market_day = local_date + timedelta(days=days)
+            run = datetime.combine(market_day, close, cls.market_timezone) + timedelta(seconds=cls.refresh_delay)
+            if market_day.weekday() < cls.week_days and run > after:
+                return run
+
+def refresh_history (local_db, symbols_list, init, scrappers=None, merge_gap=0, max_workers=4, commit_size=1000,
+                     daily=False):
+    """Actualiza los precios de un portafolio con activos de distintos
+    orígenes, consultando cada proveedor en paralelo, y devuelve el reporte de
+    la ingesta de cada origen"""
+
+    # Ordena los símbolos del más atrasado al más reciente
+    last_dates = local_db.consult_scrap_date(symbols_list)
+    symbols_list = sorted(symbols_list, key=lambda symbol_key: last_dates.get(symbol_key, date.min))
+
+    # Agrupa los símbolos por el origen de sus precios
+    scrappers = { src.strip().lower() : scrapper for src, scrapper in (scrappers or {}).items() }
+    groups, skipped = group_sources(local_db.consult_symbols_sources(symbols_list), scrappers)
+
+    # Planea e ingiere los símbolos de un proveedor
+    def refresh (src, keys):
+        scrapper = scrappers[src] if src in scrappers else provider_for(src)()
+        plan = scrapper.plan_history_from(local_db, keys, init, merge_gap)
+        return ingest.ingest_history(local_db, scrapper, plan, max_workers, commit_size, daily)
+
+    # Cada proveedor se actualiza en su propio hilo
+    with ThreadPoolExecutor(max_workers=max(len(groups), 1)) as executor:
+        futures = { src : executor.submit(refresh, src, keys) for src, keys in groups.items() }
+
+    reports = { src : failed_report(failed) for src, failed in skipped.items() }
+    for src, future in futures.items():
+        try:
+            reports[src] = future.result()
+        except Exception as error:
+            reports[src] = failed_report({ symbol_key : error for symbol_key in groups[src] })
+
+    return reports
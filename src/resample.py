@@ -0,0 +1,125 @@
+import numpy as np
+from datetime import date
+from . import database
+
+AGGREGATIONS = ("mean", "sum", "last", "ohlc", "vwap")
+
+def _weekdays (days):
+    """Devuelve el día de la semana (lunes es cero) de un arreglo de fechas
+    datetime64[D]"""
+
+    return (days.astype(np.int64) + 3) % 7
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def _as_days (dates):
+    """Convierte una secuencia de fechas en un arreglo datetime64[D]; los
+    enteros se interpretan como segundos UTC, como los guarda la base de datos"""
+
+    if isinstance(dates, np.ndarray) or len(dates) == 0 or not isinstance(next(iter(dates)), date):
+        dates = np.asarray(dates)
+        if dates.dtype.kind in "iu":
+            return database.FinancialDB.utc2datetime64(dates)
+        return dates.astype("datetime64[D]")
+    ordinals = np.fromiter(map(date.toordinal, dates), dtype=np.int64, count=len(dates))
+    return (ordinals - EPOCH_ORDINAL).astype("datetime64[D]")
+
+def resample_weekly (dates, prices, volumes=None, how="mean", week_days=7, mondays=None,
+                     skip_zeros=True, fill=0.0, digits=None):
+    """Agrupa precios diarios en semanas que empiezan en lunes y devuelve un
+    diccionario de columnas con los lunes y la agregación indicada"""
+
+    if how not in AGGREGATIONS:
+        raise ValueError(f"Agregación desconocida {how!r}, se esperaba alguna de {AGGREGATIONS}")
+    if how == "vwap" and volumes is None:
+        raise ValueError("La agregación vwap requiere los volúmenes")
+
+    days = _as_days(dates)
+    values = np.asarray(prices, dtype=np.float64)
+    weights = None if volumes is None else np.asarray(volumes, dtype=np.float64)
+
+    # Descarta los días fuera de la semana y los precios cero
+    keep = _weekdays(days) < week_days
+    if skip_zeros:
+        keep &= values != 0.0
+    days, values = days[keep], values[keep]
+    weights = None if weights is None else weights[keep]
+
+    # Ordena por fecha y encuentra el inicio de cada semana
+    order = np.argsort(days, kind="stable")
+    days, values = days[order], values[order]
+    weights = None if weights is None else weights[order]
+    weeks = days - _weekdays(days).astype("timedelta64[D]")
+    new_week = np.concatenate(([True], weeks[1:] != weeks[:-1]))[:len(weeks)]
+    starts = np.flatnonzero(new_week)
+    ends = np.append(starts[1:], len(values))
+    groups = np.cumsum(new_week) - 1
+
+    # Calcula las columnas de todas las semanas a la vez
+    columns = {"weeks" : weeks[starts], "count" : ends - starts}
+    if len(starts) == 0:
+        empty = np.array([], dtype=np.float64)
+        columns.update({name : empty for name in _names(how)})
+    elif how == "mean":
+        columns["mean"] = np.bincount(groups, weights=values) / columns["count"]
+    elif how == "sum":
+        columns["sum"] = np.bincount(groups, weights=values)
+    elif how == "last":
+        columns["last"] = values[ends - 1]
+    elif how == "ohlc":
+        columns["open"] = values[starts]
+        columns["high"] = np.maximum.reduceat(values, starts)
+        columns["low"] = np.minimum.reduceat(values, starts)
+        columns["close"] = values[ends - 1]
+    else:
+        volume = np.bincount(groups, weights=weights)
+        columns["vwap"] = np.divide(np.bincount(groups, weights=values * weights), volume,
+                                    out=np.full(len(starts), fill), where=volume != 0)
+
+    # Usa exactamente los lunes pedidos, llenando las semanas sin precios
+    if mondays is not None:
+        columns = _reindex(columns, _as_days(mondays), fill)
+
+    if digits is not None:
+        for name in _names(how):
+            columns[name] = np.round(columns[name], digits)
+
+    return columns
+
+def _names (how):
+    """Devuelve los nombres de las columnas de valores de una agregación"""
+
+    return ("open", "high", "low", "close") if how == "ohlc" else (how,)
+
+def _reindex (columns, mondays, fill):
+    """Reordena las columnas para que correspondan a los lunes pedidos,
+    llenando con fill las semanas sin precios"""
+
+    weeks = columns["weeks"]
+    positions = np.minimum(np.searchsorted(weeks, mondays), max(len(weeks) - 1, 0))
+    found = (weeks[positions] == mondays) if len(weeks) else np.zeros(len(mondays), dtype=bool)
+
+    reindexed = {"weeks" : mondays}
+    for name, column in columns.items():
+        if name == "weeks":
+            continue
+        default = 0 if name == "count" else fill
+        reindexed[name] = np.where(found, column[positions], default) if len(weeks) else np.full(len(mondays), default)
+
+    return reindexed
+
+def from_pairs (pairs):
+    """Convierte un diccionario o una lista de parejas fecha, precio en los
+    arreglos de fechas y precios"""
+
+    if isinstance(pairs, dict):
+        dates, prices = list(pairs.keys()), list(pairs.values())
+    else:
+        dates, prices = zip(*pairs) if pairs else ((), ())
+    return _as_days(dates), np.array(prices, dtype=np.float64)
+
+def to_dict (columns, name):
+    """Convierte una columna del resultado en un diccionario con los lunes
+    como claves"""
+
+    return dict(zip(columns["weeks"].tolist(), columns[name].tolist()))
@@ -0,0 +1,104 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from . import provider
+
+class RefreshDaemon:
+    """Servicio que mantiene al día los precios de un portafolio actualizando
+    cada proveedor según el horario de su mercado"""
+
+    def __init__ (self, local_db, init, symbols_list=None, scrappers=None, merge_gap=0,
+                  max_workers=4, commit_size=1000, on_report=None, daily=False):
+        self.local_db = local_db
+        self.init = init
+        self.merge_gap = merge_gap
+        self.max_workers = max_workers
+        self.commit_size = commit_size
+        self.daily = daily
+        self.on_report = on_report
+
+        # Agrupa los símbolos por el origen de sus precios
+        scrappers = { src.strip().lower() : scrapper for src, scrapper in (scrappers or {}).items() }
+        self.groups, skipped = provider.group_sources(local_db.consult_symbols_sources(symbols_list), scrappers)
+
+        # Construye un scrapper por proveedor, a menos que ya se haya dado
+        self.scrappers = { src : scrappers[src] if src in scrappers else provider.provider_for(src)()
+                           for src in self.groups }
+
+        now = datetime.now(timezone.utc)
+        self.next_runs = { src : now for src in self.groups }
+        self.running = {}
+        self.coalesced = { src : 0 for src in self.groups }
+        self.reports = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(len(self.groups), 1))
+        self._stop = threading.Event()
+
+        # Reporta los símbolos que no se pueden consultar
+        for src, failed in skipped.items():
+            self.reports[src] = provider.failed_report(failed)
+            if on_report is not None:
+                on_report(src, self.reports[src])
+
+    def _refresh (self, src):
+        """Actualiza los símbolos de un proveedor y devuelve el reporte de su
+        ingesta"""
+
+        reports = provider.refresh_history(self.local_db, self.groups[src], self.init,
+                                           { src : self.scrappers[src] }, self.merge_gap,
+                                           self.max_workers, self.commit_size, self.daily)
+        return reports[src]
+
+    def run_pending (self, now=None):
+        """Lanza las actualizaciones que ya deben hacerse, combina las que se
+        traslapan con una en curso y recoge las que terminaron"""
+
+        now = datetime.now(timezone.utc) if now is None else now
+        self._collect()
+
+        started = []
+        for src, run_at in self.next_runs.items():
+            if run_at > now:
+                continue
+            if src in self.running:
+                self.coalesced[src] += 1
+            else:
+                self.running[src] = self._executor.submit(self._refresh, src)
+                started.append(src)
+            self.next_runs[src] = type(self.scrappers[src]).next_refresh(now)
+
+        return started
+
+    def _collect (self):
+        """Recoge los reportes de las actualizaciones que terminaron"""
+
+        for src, future in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[src]
+            try:
+                report = future.result()
+            except Exception as error:
+                report = provider.failed_report({ symbol_key : error for symbol_key in self.groups[src] })
+            self.reports[src] = report
+            if self.on_report is not None:
+                self.on_report(src, report)
+
+    def run_forever (self, poll=60):
+        """Mantiene al día los precios hasta que se llame a stop"""
+
+        try:
+            while not self._stop.is_set():
+                self.run_pending()
+
+                # Espera hasta la siguiente actualización o hasta poll segundos
+                now = datetime.now(timezone.utc)
+                wait = min(((run_at - now).total_seconds() for run_at in self.next_runs.values()), default=poll)
+                self._stop.wait(min(max(wait, 0), poll))
+        finally:
+            self._executor.shutdown(wait=True)
+            self._collect()
+
+    def stop (self):
+        """Detiene el ciclo principal"""
+
+        self._stop.set()
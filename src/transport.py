@@ -0,0 +1,203 @@
+import codecs, json, threading, time
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+def build_session (pool_size=10, retries=3, backoff=0.5):
+    """Crea una sesión de requests que reutiliza conexiones, con un pool de
+    conexiones por servidor y reintentos con espera exponencial"""
+
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    # Define las reglas de reintento para las consultas GET
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUS,
+                  allowed_methods=frozenset(["GET"]), respect_retry_after_header=True)
+
+    # Monta el adaptador con el pool de conexiones en ambos protocolos
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+class TokenBucket:
+    """Limitador de tasa de consultas que permite rate consultas cada per
+    segundos con ráfagas de hasta burst consultas"""
+
+    def __init__ (self, rate, per=1.0, burst=None):
+        self.capacity = rate if burst is None else burst
+        self.fill_rate = rate / per
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire (self, tokens=1):
+        """Espera hasta que haya tokens disponibles y los consume"""
+
+        while True:
+            with self.lock:
+                # Rellena la cubeta con el tiempo transcurrido
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+
+                # Si alcanza, consume los tokens y termina
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+
+                # Si no, calcula cuánto falta para tenerlos
+                wait = (tokens - self.tokens) / self.fill_rate
+
+            time.sleep(wait)
+
+class CreditsExhausted(Exception):
+    """Excepción que indica que una consulta excede el presupuesto de créditos"""
+
+class CreditBudget:
+    """Contador de créditos gastados con un límite opcional"""
+
+    def __init__ (self, limit=None):
+        self.limit = limit
+        self.spent = 0
+        self.lock = threading.Lock()
+
+    def charge (self, credits):
+        """Carga los créditos al presupuesto o lanza CreditsExhausted si se
+        excede el límite"""
+
+        with self.lock:
+            if self.limit is not None and self.spent + credits > self.limit:
+                raise CreditsExhausted(f"{self.spent} + {credits} créditos exceden el límite de {self.limit}")
+            self.spent += credits
+
+    def remaining (self):
+        """Devuelve los créditos disponibles o None si no hay límite"""
+
+        return None if self.limit is None else self.limit - self.spent
+
+class JSONStream:
+    """Lector incremental de JSON que recorre objetos y arreglos a partir de
+    bloques de bytes sin construir el documento completo"""
+
+    delimiters = ",]}: \t\n\r"
+
+    def __init__ (self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.parser = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.exhausted = False
+
+    def _fill (self):
+        """Agrega el siguiente bloque al buffer descartando lo ya procesado y
+        devuelve False si ya no hay bloques"""
+
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.exhausted = True
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(b"", final=True)
+        else:
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(chunk)
+        self.pos = 0
+        return chunk is not None
+
+    def _peek (self):
+        """Salta los espacios y devuelve el siguiente carácter sin consumirlo"""
+
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\n\r":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("JSON incompleto")
+
+    def _expect (self, chars):
+        """Consume el siguiente carácter, que debe ser alguno de chars"""
+
+        char = self._peek()
+        if char not in chars:
+            raise ValueError(f"Se esperaba {chars!r} y se encontró {char!r} en el JSON")
+        self.pos += 1
+        return char
+
+    def value (self):
+        """Lee y devuelve el siguiente valor completo"""
+
+        self._peek()
+        while True:
+            try:
+                value, end = self.parser.raw_decode(self.buffer, self.pos)
+                if (end < len(self.buffer) and self.buffer[end] in self.delimiters) or self.exhausted:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self._fill()
+
+    def members (self):
+        """Recorre un objeto devolviendo sus claves; después de cada clave
+        debe leerse su valor con value, skip o elements"""
+
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(":")
+            yield key
+            if self._expect(",}") == "}":
+                return
+
+    def elements (self):
+        """Recorre un arreglo; en cada paso debe leerse el elemento con value,
+        skip o elements"""
+
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self._expect(",]") == "]":
+                return
+
+    def skip (self):
+        """Descarta el siguiente valor recorriendo arreglos y objetos sin
+        construirlos"""
+
+        char = self._peek()
+        if char == "[":
+            for _ in self.elements():
+                self.skip()
+        elif char == "{":
+            for _ in self.members():
+                self.skip()
+        else:
+            self.value()
+
+def iter_members (chunks):
+    """Devuelve las parejas clave, valor del objeto principal de un JSON que
+    llega en bloques de bytes"""
+
+    stream = JSONStream(chunks)
+    for key in stream.members():
+        yield key, stream.value()
+
+def iter_elements (chunks, member):
+    """Devuelve los elementos del arreglo guardado en la clave member del
+    objeto principal de un JSON que llega en bloques de bytes"""
+
+    stream = JSONStream(chunks)
+    for key in stream.members():
+        if key != member:
+            stream.skip()
+            continue
+        for _ in stream.elements():
+            yield stream.value()
@@ -0,0 +1,61 @@
+import sqlite3
+from datetime import date
+
+from src import database
+
+
+def test_bulk_insert_buys_unpadded_dates(tmp_path):
+    local_db = database.FinancialDB(str(tmp_path / "buys.db"))
+    local_db.bulk_insert_product([["Sección", "Emisora", "Serie", "Origen", "Tipo", "Compañía", "Notas"],
+                                  ["ETF", "VOO", "*", "DataBursatil", "", "", ""]])
+
+    # Dos filas de encabezado y una compra con la fecha sin ceros a la izquierda
+    header = [""] * 13
+    buy = ["", "", "VOO", "*", "2024-1-5", "DONE", 2, "", "", "", "", 800.0, ""]
+    local_db.bulk_insert_buys([header, header, buy], [header, header])
+
+    assert database.FinancialDB._isodate2utc("2024-1-5") == database.FinancialDB._isodate2utc("2024-01-05")
+    timetable, initial_buys = local_db.consult_buys_timetable([("VOO", "*")], date(2024, 1, 1), date(2024, 1, 31))
+    assert timetable[("VOO", "*")] == {date(2024, 1, 5) : 800.0}
+
+
+def test_migration_rebuilds_tables_without_unique(tmp_path):
+    path = str(tmp_path / "legacy.db")
+
+    # Base de datos antigua: precios y compras sin restricción de unicidad
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE products (id INTEGER UNIQUE PRIMARY KEY, symbol TEXT NOT NULL, serie TEXT, src TEXT, secc TEXT,
+                               UNIQUE(symbol, serie));
+        CREATE TABLE prices (id INTEGER PRIMARY KEY, symbol INTEGER NOT NULL, date INTEGER NOT NULL,
+                             price REAL NOT NULL);
+        CREATE TABLE buys (id INTEGER PRIMARY KEY, symbol INTEGER NOT NULL, qty REAL NOT NULL, price REAL NOT NULL,
+                           date INTEGER NOT NULL);
+        INSERT INTO products(id, symbol, serie, src, secc) VALUES (1, 'VOO', '*', 'DataBursatil', 'ETF');""")
+    utc_buy = database.FinancialDB._isodate2utc("2024-01-05")
+    utc_price = database.FinancialDB._isodate2utc("2024-01-08")
+    connection.executemany("INSERT INTO buys(symbol, qty, price, date) VALUES (1, 2, 800.0, ?)", [(utc_buy,)] * 2)
+    connection.executemany("INSERT INTO prices(symbol, date, price) VALUES (1, ?, ?)",
+                           [(utc_price, 410.0), (utc_price, 420.0)])
+    connection.commit()
+    connection.close()
+
+    local_db = database.FinancialDB(path)
+
+    # Las filas repetidas se descartan y volver a importar no las duplica
+    header = [""] * 13
+    buy = ["", "", "VOO", "*", "2024-01-05", "DONE", 2, "", "", "", "", 800.0, ""]
+    local_db.bulk_insert_buys([header, header, buy], [header, header])
+    local_db.bulk_insert_prices({("VOO", "*") : {date(2024, 1, 8) : 430.0}})
+
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT COUNT(*) FROM buys").fetchone()[0] == 1
+    assert connection.execute("SELECT date, price FROM prices").fetchall() == [(utc_price, 410.0)]
+    assert connection.execute("SELECT qty FROM positions").fetchall() == [(2.0,)]
+    connection.close()
+
+
+def test_migration_keeps_new_tables(tmp_path):
+    for without_rowid in (False, True):
+        local_db = database.FinancialDB(str(tmp_path / f"new_{without_rowid}.db"), without_rowid=without_rowid)
+        assert not any(local_db._rebuild_table(table) for table in database.SCHEMA_UNIQUE)
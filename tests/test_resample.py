@@ -0,0 +1,65 @@
+import json
+from datetime import date, datetime, time, timedelta, timezone
+
+import numpy as np
+
+from src import coingecko, database, resample
+
+
+def test_resample_stored_columnar_prices(tmp_path):
+    local_db = database.FinancialDB(str(tmp_path / "prices.db"))
+    local_db.bulk_insert_product([["Sección", "Emisora", "Serie", "Origen", "Tipo", "Compañía", "Notas"],
+                                  ["ETF", "VOO", "*", "DataBursatil", "", "", ""]])
+
+    # Dos semanas de días hábiles, con el mismo precio dentro de cada semana
+    first_monday = date(2024, 1, 1)
+    prices = { first_monday + timedelta(weeks=week, days=day) : 100.0 + 10 * week
+               for week in range(2) for day in range(5) }
+    local_db.bulk_insert_daily_prices({("VOO", "*") : prices})
+
+    columns = local_db.consult_price_history([("VOO", "*")], first_monday, first_monday + timedelta(days=13),
+                                             resolution="daily", columnar=True)[("VOO", "*")]
+    weekly = resample.resample_weekly(columns["dates"], columns["values"], week_days=5)
+
+    assert weekly["weeks"].tolist() == [first_monday, first_monday + timedelta(weeks=1)]
+    assert weekly["count"].tolist() == [5, 5]
+    assert np.allclose(weekly["mean"], [100.0, 110.0])
+
+
+class _Response:
+    def __init__(self, body, chunk_size):
+        self.body, self.chunk_size = body, chunk_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+class _Session:
+    def __init__(self, body, chunk_size=65536):
+        self.body, self.chunk_size = body, chunk_size
+
+    def get(self, URL, timeout=None, stream=False):
+        return _Response(self.body, self.chunk_size)
+
+
+def test_stream_coingecko_weekly_means():
+    # Dos semanas de precios diarios con el formato de market_chart/range
+    first_monday = date(2024, 1, 1)
+    days = [first_monday + timedelta(days=day) for day in range(14)]
+    stamps = [int(datetime.combine(day, time.min, timezone.utc).timestamp()) * 1000 for day in days]
+    prices = [100.0 + 10 * (day // 7) for day in range(14)]
+    body = json.dumps({"prices" : [[stamp, price] for stamp, price in zip(stamps, prices)],
+                       "market_caps" : [[stamp, 1e9] for stamp in stamps],
+                       "total_volumes" : [[stamp, 1e6] for stamp in stamps]}).encode()
+
+    scrapper = coingecko.CoinGecko(session=_Session(body))
+    weekly = dict(scrapper.iter_weekly_mean_price_history(first_monday, first_monday + timedelta(weeks=2), "bitcoin"))
+
+    assert weekly == {first_monday : 100.0, first_monday + timedelta(weeks=1) : 110.0}
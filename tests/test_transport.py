@@ -0,0 +1,22 @@
+import json
+
+from src import transport
+
+
+def test_iter_elements_one_byte_chunks():
+    # Números con decimales y exponentes cortados en cada byte
+    prices = [[1704067200000 + day * 86400000, 12345.67 + day] for day in range(20)]
+    body = json.dumps({"prices" : prices,
+                       "market_caps" : [[stamp, 1.5e9] for stamp, _ in prices],
+                       "total_volumes" : [[stamp, -2.25e-3] for stamp, _ in prices]}).encode()
+    chunks = (body[start:start + 1] for start in range(len(body)))
+
+    assert list(transport.iter_elements(chunks, "prices")) == prices
+
+
+def test_iter_members_one_byte_chunks():
+    document = {"a" : 12345.67, "b" : [1, 2.5, -3e2], "c" : {"d" : None, "e" : True}, "f" : "texto"}
+    body = json.dumps(document).encode()
+    chunks = (body[start:start + 1] for start in range(len(body)))
+
+    assert dict(transport.iter_members(chunks)) == document